@@ -0,0 +1,126 @@
+import asyncio
+import collections
+import threading
+import time
+
+
+class _Waiter:
+    """A request queued for a slot: a threading.Event, or an asyncio future on `loop`."""
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.granted = False
+        self.signal = threading.Event() if loop is None else loop.create_future()
+
+    def wake(self):
+        if self.loop is None:
+            self.signal.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.signal.done():
+            self.signal.set_result(True)
+
+
+class ConcurrencyLimit:
+    """
+    At most `limit` requests of one route class at a time per worker. Up to
+    `queue` more wait, first come first served, for at most `timeout`
+    seconds; beyond that a request is shed at once. A spike then turns into
+    fast 503s for the excess instead of every request queueing on the
+    database pool until the router's 30 s timeout.
+
+    acquire() waits on a threading.Event, which gunicorn's gevent worker
+    patches into a cooperative one; acquire_async() waits on an asyncio
+    future, for asgi.py's native views. Both draw on the same slots, and
+    release() hands a freed slot straight to the oldest waiter.
+    """
+
+    def __init__(self, name, limit, queue=0, timeout=1.0):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self._waiters = collections.deque()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.waited = 0
+        self.shed = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+
+    def acquire(self):
+        """True once the request holds a slot; False when it is shed."""
+        waiter = self._enter()
+        if waiter is None or waiter is True:
+            return bool(waiter)
+        started = time.perf_counter()
+        waiter.signal.wait(self.timeout)
+        return self._done_waiting(waiter, started)
+
+    async def acquire_async(self):
+        waiter = self._enter(asyncio.get_running_loop())
+        if waiter is None or waiter is True:
+            return bool(waiter)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.signal), self.timeout)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            # Cancelled (the client went away): give back a slot handed over meanwhile
+            if self._done_waiting(waiter, started):
+                self.release()
+            raise
+        return self._done_waiting(waiter, started)
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.granted = True  # the slot passes on, so `active` stays
+                waiter.wake()
+            else:
+                self.active -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "active": self.active,
+                "queued": len(self._waiters),
+                "queue_limit": self.queue,
+                "admitted": self.admitted,
+                "waited": self.waited,
+                "shed": self.shed,
+                "timeouts": self.timeouts,
+                "wait_seconds": round(self.wait_seconds, 6),
+            }
+
+    def _enter(self, loop=None):
+        """True (admitted), None (shed) or the _Waiter to wait on."""
+        with self._lock:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                self.admitted += 1
+                return True
+            if len(self._waiters) >= self.queue:
+                self.shed += 1
+                return None
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _done_waiting(self, waiter, started):
+        with self._lock:
+            self.wait_seconds += time.perf_counter() - started
+            if waiter.granted:
+                self.admitted += 1
+                self.waited += 1
+                return True
+            # Still queued, so release() can no longer hand it a slot
+            self._waiters.remove(waiter)
+            self.timeouts += 1
+            return False
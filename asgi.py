@@ -0,0 +1,836 @@
+"""
+ASGI entry point: the lead API on asyncio, under gunicorn's uvicorn worker.
+
+    gunicorn -w 4 -k uvicorn.workers.UvicornWorker asgi:app
+
+(`uvicorn asgi:app --workers 4` serves it too, but its own multi-process
+mode leaves TCP_NODELAY off, which adds ~40 ms to larger responses.)
+
+The insert / get / update routes are native async handlers that talk to
+Postgres through psycopg 3's asyncio driver (create_async_engine). They run
+inside a Flask request context of app.py's app, so request parsing, the
+response payloads, JSON encoding, lead_cache, ETags, compression, CORS,
+logging and /metrics are the very same code, and every response matches the
+Flask view's.
+
+Any other route (batch, stream, wait_for_result, get_users, metrics, ...),
+inserts queued for write-behind ingest or sent with an Idempotency-Key,
+OPTIONS preflights and HEAD requests are handed to the Flask WSGI app on a
+worker thread, so nothing is lost by serving through this module. Those
+threads come from bounded pools of their own (ASGI_WSGI_THREADS, and
+ASGI_WAIT_THREADS for /wait_for_result's long polls); a request that finds
+its pool busy gets a 503, and a client that disconnects ends its wait. Request
+bodies are read in full before dispatch, including the /stream endpoints,
+up to MAX_CONTENT_LENGTH. Native views wait for their admission slot on
+the event loop; the Flask hooks take it for everything else.
+
+With DATABASE_REPLICA_URLS the native lookups read from the replicas the
+way app.py's RoutingSession does, through async engines of their own.
+
+The Redis lead_cache backend and the markdown renderer are synchronous and
+run on the event loop, as they run on a gevent worker's hub.
+"""
+import asyncio
+import contextvars
+import io
+import sys
+import time
+import urllib
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g, jsonify, request, request_started
+from sqlalchemy import Text, bindparam, event, select, text, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app import (
+    ADMISSION_ROUTES, AUDIO_FIELDS, AUDIO_NOT_FOUND_PAYLOAD, DISCONNECT_CALLBACKS, USER_NOT_FOUND_PAYLOAD, Prognostic,
+    PrognosticPsych, ResultsOne, ResultsTwo, UserAudio, audio_payload, body_too_large, check_schema_version,
+    conditional_request, ingest_requested, invalidate_lead, lead_cache, lead_key, lead_lookup, log_custom_message,
+    log_headers, markdown_to_html, not_modified_response, projected_row, projection_columns, query_finished,
+    query_started, refuse_request, replica_router, report_response, requested_fields, results_two_payload,
+    row_version, set_version_headers, text_lead_payload, version_columns,
+)
+from app import app as flask_app
+from db_drivers import database_uri
+from db_pool import engine_options
+from lead_events import notification_payload, notify_statement
+from metrics import timed_phase
+from read_replicas import CURRENT_LSN, REPLAY_LSN
+from upsert import prepare_values, upsert_statement
+
+# psycopg 3 is the async driver, whatever DB_DRIVER the WSGI side uses; the
+# DB_POOL* settings size these pools like the WSGI ones.
+ASYNC_ENGINE_OPTIONS = engine_options(
+    pooler=flask_app.config['DB_POOLER'],
+    driver='psycopg',
+    pool_size=flask_app.config['DB_POOL_SIZE'],
+    max_overflow=flask_app.config['DB_MAX_OVERFLOW'],
+    pool_timeout=flask_app.config['DB_POOL_TIMEOUT'],
+    pool_recycle=flask_app.config['DB_POOL_RECYCLE'],
+    pool_pre_ping=flask_app.config['DB_POOL_PRE_PING'],
+    pool_use_lifo=flask_app.config['DB_POOL_LIFO'],
+    asyncio=True,
+)
+async_engine = create_async_engine(
+    database_uri(flask_app.config['SQLALCHEMY_DATABASE_URI'], 'psycopg'), **ASYNC_ENGINE_OPTIONS)
+# Read replica bind name -> engine, for the lookups app.route_reads() lets go to a replica
+replica_engines = {
+    name: create_async_engine(database_uri(url, 'psycopg'), **ASYNC_ENGINE_OPTIONS)
+    for name, url in flask_app.config['SQLALCHEMY_BINDS'].items()
+}
+# db_query phase for /metrics, like the WSGI engines
+for engine in [async_engine, *replica_engines.values()]:
+    event.listen(engine.sync_engine, 'before_cursor_execute', query_started)
+    event.listen(engine.sync_engine, 'after_cursor_execute', query_finished)
+
+NOTIFY_LEADS = text(notify_statement()).bindparams(bindparam('payloads', type_=ARRAY(Text)))
+
+
+# ------------------------------------------------------------------
+# Async counterparts of app.py's lookup and write helpers.
+# ------------------------------------------------------------------
+async def read_replica():
+    """RoutingSession.read_replica(), checking replay positions on the replica engines."""
+    if 'read_after' not in g:
+        return None
+    if 'read_replica' not in g:
+        g.read_replica = None
+        for name in replica_router.candidates():
+            if replica_router.needs_check(name, g.read_after):
+                try:
+                    async with replica_engines[name].connect() as connection:
+                        replica_router.replayed(name, (await connection.execute(REPLAY_LSN)).scalar())
+                except Exception as e:
+                    replica_router.failed(name, e)
+                    continue
+            if replica_router.caught_up(name, g.read_after):
+                g.read_replica = name
+                break
+        replica_router.chose(g.read_replica)
+    return g.read_replica
+
+
+async def fetch_first(query):
+    """The first row of a lookup, from this request's replica if any (app.replica_read())."""
+    name = await read_replica()
+    if name is not None:
+        try:
+            async with replica_engines[name].connect() as connection:
+                row = (await connection.execute(query)).first()
+        except (OperationalError, InterfaceError) as e:
+            replica_router.failed(name, e)
+            row = None
+        if row is not None:
+            return row
+        replica_router.fell_back(name)
+        g.read_replica = None
+    async with async_engine.connect() as connection:
+        return (await connection.execute(query)).first()
+
+
+async def written_lsn(connection):
+    """app.written_lsn(), on the connection that just committed."""
+    if not replica_router.names:
+        return None
+    return (await connection.execute(CURRENT_LSN)).scalar()
+
+
+async def cached_lookup(model, user_email, payload):
+    """app.cached_lookup()."""
+    key = lead_key(model, user_email)
+    response_data = lead_cache.get(key)
+    if response_data is None:
+        generations = lead_cache.generation(key), lead_cache.generation(key + ('version',))
+        row = await fetch_first(select(model.__table__).where(lead_lookup(model, user_email)))
+        if row is None:
+            return None
+        response_data = payload(row)
+        lead_cache.set(key, response_data, generation=generations[0])
+        lead_cache.set(key + ('version',), row_version(row), generation=generations[1])
+    return response_data
+
+
+async def lead_version(model, user_email):
+    """app.lead_version()."""
+    key = lead_key(model, user_email, 'version')
+    version = lead_cache.get(key)
+    if version is None:
+        generation = lead_cache.generation(key)
+        row = await fetch_first(select(*version_columns(model)).where(lead_lookup(model, user_email)))
+        if row is None:
+            return None
+        version = row_version(row)
+        lead_cache.set(key, version, generation=generation)
+    return version
+
+
+async def projected_lookup(model, user_email, payload, fields):
+    """app.projected_lookup()."""
+    cached = lead_cache.get(lead_key(model, user_email))
+    version = await lead_version(model, user_email) if cached is not None else None
+    if version is not None:
+        return {field: cached[field] for field in fields}, version
+
+    query = select(*projection_columns(model, fields)).where(lead_lookup(model, user_email))
+    return projected_row(await fetch_first(query), payload, fields)
+
+
+async def not_modified(model, user_email):
+    """app.not_modified()."""
+    if not conditional_request():
+        return None
+    return not_modified_response(user_email, await lead_version(model, user_email))
+
+
+async def notify_leads(connection, model, user_emails):
+    """app.notify_leads(), inside `connection`'s transaction."""
+    if not flask_app.config['LEAD_NOTIFY'] or not user_emails:
+        return
+    await connection.execute(
+        NOTIFY_LEADS, {'payloads': [notification_payload(*lead_key(model, email)) for email in user_emails]})
+
+
+async def commit(connection):
+    with timed_phase('commit'):
+        await connection.commit()
+
+
+async def upsert_lead(model, values):
+    """upsert.upsert_row() + NOTIFY + commit + invalidate. Returns (primary_key, inserted)."""
+    async with async_engine.connect() as connection:
+        row = (await connection.execute(upsert_statement(model.__table__), prepare_values(model, values))).one()
+        await notify_leads(connection, model, [values['user_email']])
+        await commit(connection)
+        lsn = await written_lsn(connection)
+    invalidate_lead(model, values['user_email'], lsn)
+    return row.pk, bool(row.inserted)
+
+
+def request_details():
+    """The request fields every log record of the views starts with."""
+    return {
+        "event_time": time.time(),
+        "method": request.method,
+        "url": request.url,
+        "remote_addr": request.remote_addr,
+        "headers": log_headers(),
+    }
+
+
+# ------------------------------------------------------------------
+# Views. Same status codes, bodies and log records as the Flask views.
+# ------------------------------------------------------------------
+def insert_lead_view(model, label):
+    """
+    /insert_user, /insert_user_psych, /insert_user_one and /insert_user_two.
+    ResultsTwo also takes lead_email for user_email, an empty text and the
+    audio columns.
+    """
+    results_two = model is ResultsTwo
+    title = label.capitalize()
+
+    async def view():
+        start_time = time.time()
+        data = request.json
+        user_email = data.get('user_email')
+        text_content = data.get('text')
+        booking_button_name = data.get('booking_button_name')
+        booking_button_redirection = data.get('booking_button_redirection')
+
+        if not user_email and results_two:
+            user_email = data.get('lead_email', None)
+        if not user_email:
+            response = jsonify({'error': 'user_email is required'})
+            response.status_code = 400
+            extra_data = {
+                **request_details(),
+                "response_status": response.status_code,
+                "elapsed_time": f"{time.time() - start_time:.4f} seconds",
+            }
+            log_custom_message(f"Insert {label} failed", extra_data)
+            return response
+
+        if results_two:
+            decoded_text = urllib.parse.unquote(text_content) if text_content else ''
+        else:
+            decoded_text = urllib.parse.unquote(text_content)
+        user_uuid = uuid.uuid4()
+        transformed_text = markdown_to_html(decoded_text)
+        values = {
+            'user_id': user_uuid,
+            'user_email': user_email,
+            'text': transformed_text,
+            'booking_button_name': booking_button_name,
+            'booking_button_redirection': booking_button_redirection,
+        }
+        if results_two:
+            values.update({field: data.get(field, '') for field in AUDIO_FIELDS})
+
+        try:
+            user_id, created = await upsert_lead(model, values)
+            verb = 'added' if created else 'overwritten'
+            response = jsonify({'message': f'{title} {verb} successfully!', 'user_id': str(user_id)})
+            response.status_code = 201 if created else 200
+
+            extra_data = {
+                **request_details(),
+                "request_body": {
+                    "user_email": user_email,
+                    "booking_button_name": booking_button_name,
+                    "booking_button_redirection": booking_button_redirection,
+                    "text": "Not produced, its too big",
+                },
+                "response_status": response.status_code,
+                "elapsed_time": f"{time.time() - start_time:.4f} seconds",
+            }
+            log_custom_message(f"{title} {verb} successfully", extra_data)
+            return response
+
+        except Exception as e:
+            response = jsonify({'error': str(e)})
+            response.status_code = 400
+
+            extra_data = {
+                **request_details(),
+                "request_body": {
+                    "user_email": user_email
+                },
+                "response_status": response.status_code,
+                "error": str(e),
+                "elapsed_time": f"{time.time() - start_time:.4f} seconds",
+            }
+            log_custom_message(f"Error while inserting {label}", extra_data)
+            return response
+
+    return view
+
+
+def get_lead_view(model, label, payload):
+    """
+    /get_user, /get_user_psych, /get_user_one and /get_user_two; ResultsTwo
+    also takes a fields selection (?fields= or "fields" in the body).
+    """
+    results_two = model is ResultsTwo
+    title = label.capitalize()
+
+    async def view():
+        start_time = time.time()
+        data = request.get_json()
+        user_email = data.get('user_email')
+
+        if not user_email:
+            response = jsonify({"error": "Email parameter is required"})
+            response.status_code = 400
+            extra_data = {
+                **request_details(),
+                "request_body": data,
+                "response_status": response.status_code,
+                "elapsed_time": f"{time.time() - start_time:.4f} seconds",
+            }
+            log_custom_message(f"Get {label} failed", extra_data)
+            return response
+
+        try:
+            response = await not_modified(model, user_email)
+            if response is not None:
+                return response
+
+            fields = None
+            if results_two:
+                fields = requested_fields(request.args.get('fields') or data.get('fields'), payload)
+            if fields:
+                response_data, version = await projected_lookup(model, user_email, payload, fields)
+            else:
+                response_data = await cached_lookup(model, user_email, payload)
+            if response_data:
+                elapsed_time = time.time() - start_time
+                if fields:
+                    response = set_version_headers(jsonify(response_data), version)
+                else:
+                    response = report_response(model, user_email, response_data,
+                                               await lead_version(model, user_email))
+                response.status_code = 200
+
+                extra_data = {
+                    **request_details(),
+                    "response_status": response.status_code,
+                    "response_body": {
+                        "success": True,
+                        "user_email": user_email if results_two else response_data["user_email"],
+                        "text": "Not produced, its too big",
+                        "booking_button_name": response_data.get("booking_button_name"),
+                        "booking_button_redirection": response_data.get("booking_button_redirection"),
+                        "length": response_data.get("length")
+                    },
+                    "user_email": user_email,
+                    "elapsed_time": f"{elapsed_time:.4f} seconds",
+                }
+                if results_two:
+                    extra_data["fields"] = fields
+                log_custom_message(f"Get {label} operation", extra_data)
+                return response
+            else:
+                elapsed_time = time.time() - start_time
+                response = jsonify(USER_NOT_FOUND_PAYLOAD)
+                response.status_code = 404
+
+                extra_data = {
+                    **request_details(),
+                    "request_body": data,
+                    "response_status": response.status_code,
+                    "response_body": response.get_json(),
+                    "user_email": user_email,
+                    "elapsed_time": f"{elapsed_time:.4f} seconds",
+                }
+                log_custom_message(f"{title} not found", extra_data)
+                return response
+
+        except Exception as e:
+            response = jsonify({"error": str(e)})
+            response.status_code = 400
+
+            extra_data = {
+                **request_details(),
+                "request_body": data,
+                "response_status": response.status_code,
+                "response_body": response.get_json(),
+                "user_email": user_email,
+                "error": str(e),
+                "elapsed_time": f"{time.time() - start_time:.4f} seconds",
+            }
+            log_custom_message(f"Error while fetching {label}", extra_data)
+            return response
+
+    return view
+
+
+async def insert_audio():
+    data = request.json
+
+    user_email = data.get('user_email')
+    if not user_email:
+        user_email = data.get('lead_email')
+
+    if not user_email:
+        return jsonify({"error": "Missing user_email or lead_email"}), 400
+
+    audio_fields = {field: data.get(field, '') for field in AUDIO_FIELDS}
+
+    try:
+        _, created = await upsert_lead(UserAudio, {
+            'user_email': user_email,
+            **audio_fields,
+        })
+
+        if not created:
+            return jsonify({"message": "Audio overwritten successfully"}), 200
+        else:
+            return jsonify({"message": "Audio inserted successfully"}), 201
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+async def get_audio():
+    user_email = request.args.get('user_email')
+    if not user_email:
+        return jsonify({"error": "No user_email provided"}), 400
+
+    try:
+        fields = requested_fields(request.args.get('fields'), audio_payload)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        response = await not_modified(UserAudio, user_email)
+        if response is not None:
+            return response
+
+        if fields:
+            response_data, version = await projected_lookup(UserAudio, user_email, audio_payload, fields)
+            if response_data is None:
+                return jsonify({field: AUDIO_NOT_FOUND_PAYLOAD[field] for field in fields}), 200
+            return set_version_headers(jsonify(response_data), version), 200
+
+        response_data = await cached_lookup(UserAudio, user_email, audio_payload)
+        if response_data:
+            return report_response(UserAudio, user_email, response_data,
+                                   await lead_version(UserAudio, user_email)), 200
+        else:
+            return jsonify(AUDIO_NOT_FOUND_PAYLOAD), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+async def update_lead():
+    start_time = time.time()
+    data = request.json
+    user_email = data.get('user_email')
+    text_content = data.get('text')
+    booking_button_name = data.get('booking_button_name')
+    booking_button_redirection = data.get('booking_button_redirection')
+
+    if not user_email:
+        response = jsonify({'error': 'user_email is required'})
+        response.status_code = 400
+        extra_data = {
+            **request_details(),
+            "response_status": response.status_code,
+            "elapsed_time": f"{time.time() - start_time:.4f} seconds",
+        }
+        log_custom_message("Update lead failed - no user_email", extra_data)
+        return response
+
+    decoded_text = urllib.parse.unquote(text_content) if text_content else ''
+    transformed_text = markdown_to_html(decoded_text)
+
+    try:
+        table = Prognostic.__table__
+        # updated_at comes from the column's onupdate, as with the ORM flush
+        statement = update(table).where(lead_lookup(Prognostic, user_email)).values(
+            text=transformed_text,
+            booking_button_name=booking_button_name,
+            booking_button_redirection=booking_button_redirection,
+        ).returning(table.c.user_id)
+        async with async_engine.connect() as connection:
+            user_id = (await connection.execute(statement)).scalar()
+            if user_id is not None:
+                await notify_leads(connection, Prognostic, [user_email])
+                await commit(connection)
+                lsn = await written_lsn(connection)
+
+        if user_id is not None:
+            invalidate_lead(Prognostic, user_email, lsn)
+
+            elapsed_time = time.time() - start_time
+            response = jsonify({'message': 'Lead updated successfully!', 'user_id': str(user_id)})
+            response.status_code = 200
+
+            extra_data = {
+                **request_details(),
+                "request_body": {
+                    "user_email": user_email,
+                    "booking_button_name": booking_button_name,
+                    "booking_button_redirection": booking_button_redirection,
+                    "text": "Not produced, its too big"
+                },
+                "response_status": response.status_code,
+                "elapsed_time": f"{elapsed_time:.4f} seconds",
+            }
+            log_custom_message("Lead updated successfully", extra_data)
+            return response
+        else:
+            elapsed_time = time.time() - start_time
+            response = jsonify({'error': 'No existing lead found with that email'})
+            response.status_code = 404
+
+            extra_data = {
+                **request_details(),
+                "request_body": data,
+                "response_status": response.status_code,
+                "elapsed_time": f"{elapsed_time:.4f} seconds",
+            }
+            log_custom_message("No lead found to update", extra_data)
+            return response
+
+    except Exception as e:
+        response = jsonify({'error': str(e)})
+        response.status_code = 400
+
+        extra_data = {
+            **request_details(),
+            "request_body": data,
+            "response_status": response.status_code,
+            "error": str(e),
+            "elapsed_time": f"{time.time() - start_time:.4f} seconds",
+        }
+        log_custom_message("Error while updating lead", extra_data)
+        return response
+
+
+# (path, method) -> async view; everything else goes to the WSGI app
+ASYNC_ROUTES = {
+    ('/insert_user', 'POST'): insert_lead_view(Prognostic, 'user'),
+    ('/insert_user_psych', 'POST'): insert_lead_view(PrognosticPsych, 'user psych'),
+    ('/insert_user_one', 'POST'): insert_lead_view(ResultsOne, 'user one'),
+    ('/insert_user_two', 'POST'): insert_lead_view(ResultsTwo, 'user two'),
+    ('/get_user', 'POST'): get_lead_view(Prognostic, 'user', text_lead_payload),
+    ('/get_user_psych', 'POST'): get_lead_view(PrognosticPsych, 'user psych', text_lead_payload),
+    ('/get_user_one', 'POST'): get_lead_view(ResultsOne, 'user one', text_lead_payload),
+    ('/get_user_two', 'POST'): get_lead_view(ResultsTwo, 'user two', results_two_payload),
+    ('/insert_audio', 'POST'): insert_audio,
+    ('/get_audio', 'GET'): get_audio,
+    ('/update_lead', 'POST'): update_lead,
+}
+
+# Inserts that go through the write-behind spool (ingest_requested()) or carry
+# an Idempotency-Key are served by the Flask views: the spool is synchronous
+# SQLite, and the key is claimed and stored by Flask hooks on the sync engine.
+INGEST_ROUTES = {
+    ('/insert_user', 'POST'), ('/insert_user_psych', 'POST'), ('/insert_user_one', 'POST'),
+    ('/insert_user_two', 'POST'), ('/insert_audio', 'POST'),
+}
+
+
+# Long polls get a thread pool of their own (ASGI_WAIT_THREADS)
+WAIT_ROUTES = {('/wait_for_result', 'GET')}
+
+
+# ------------------------------------------------------------------
+# ASGI <-> Flask plumbing
+# ------------------------------------------------------------------
+class DisconnectCallbacks(list):
+    """
+    The environ's DISCONNECT_CALLBACKS: the view appends from its thread,
+    disconnect() runs them on the loop. One appended after the disconnect
+    runs at once, so a callback may run twice; they must be idempotent.
+    """
+
+    disconnected = False
+
+    def append(self, callback):
+        super().append(callback)
+        if self.disconnected:
+            callback()
+
+    def disconnect(self):
+        self.disconnected = True
+        for callback in list(self):
+            callback()
+
+
+class WsgiThreads:
+    """
+    The threads the Flask app runs on for one group of routes. A request
+    holds one of `threads` slots from its start to the end of its body, and
+    runs each step on the pool, so it never waits for a thread; when every
+    slot is taken it is refused instead. Only used on the event loop.
+    """
+
+    def __init__(self, name, threads):
+        self.name = name
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max(threads, 1), thread_name_prefix=f'wsgi-{name}')
+        self.active = 0
+        self.refused = 0
+
+    def claim(self):
+        if self.active >= self.threads:
+            self.refused += 1
+            return False
+        self.active += 1
+        return True
+
+    def release(self):
+        self.active -= 1
+
+
+def wsgi_environ(scope, body):
+    """A WSGI environ for an ASGI http scope whose body has been read in full."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    return environ
+
+
+async def read_body(receive, limit=None):
+    """
+    The request body; past `limit` bytes reading stops, and the Flask app
+    answers 413 when it reads the truncated body.
+    """
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        size += len(chunks[-1])
+        if not message.get('more_body') or (limit is not None and size > limit):
+            return b''.join(chunks)
+
+
+def declared_length(scope):
+    for name, value in scope['headers']:
+        if name == b'content-length':
+            return int(value) if value.isdigit() else None
+    return None
+
+
+def asgi_headers(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+
+class LeadAPI:
+    """The ASGI application: ASYNC_ROUTES natively, the rest through the Flask app."""
+
+    def __init__(self, wsgi_app, routes):
+        self.wsgi_app = wsgi_app
+        self.routes = routes
+        self.wsgi_threads = WsgiThreads('wsgi', wsgi_app.config['ASGI_WSGI_THREADS'])
+        self.wait_threads = WsgiThreads('wait', wsgi_app.config['ASGI_WAIT_THREADS'])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        # A body declared over MAX_CONTENT_LENGTH is never read: app.admit_request() refuses it
+        too_large = body_too_large(declared_length(scope))
+        body = b'' if too_large else await read_body(receive, self.wsgi_app.config['MAX_CONTENT_LENGTH'])
+        environ = wsgi_environ(scope, body)
+        route = (scope['path'], scope['method'])
+        view = self.routes.get(route)
+        if view is None or (route in INGEST_ROUTES and (
+                ingest_requested(environ.get('HTTP_PREFER')) or 'HTTP_IDEMPOTENCY_KEY' in environ)):
+            threads = self.wait_threads if route in WAIT_ROUTES else self.wsgi_threads
+            return await self.call_wsgi(environ, receive, send, threads)
+
+        ctx = self.wsgi_app.request_context(environ)
+        error = None
+        ctx.push()
+        try:
+            try:
+                limit = ADMISSION_ROUTES.get(ctx.request.endpoint)
+                if limit is not None and not too_large:
+                    # Queue for the slot here rather than block the loop in app.admit_request()
+                    g.admission = await limit.acquire_async()
+                response = await self.dispatch(view)
+            except Exception as e:
+                error = e
+                response = self.wsgi_app.handle_exception(e)
+            await send({
+                'type': 'http.response.start',
+                'status': response.status_code,
+                'headers': asgi_headers(response.get_wsgi_headers(environ).to_wsgi_list()),
+            })
+            await send({'type': 'http.response.body', 'body': b''.join(response.get_app_iter(environ))})
+        finally:
+            ctx.pop(error)
+
+    async def dispatch(self, view):
+        """Flask.full_dispatch_request() with an awaited view."""
+        app = self.wsgi_app
+        try:
+            request_started.send(app, _async_wrapper=app.ensure_sync)
+            rv = app.preprocess_request()
+            if rv is None:
+                rv = await view()
+        except Exception as e:
+            rv = app.handle_user_exception(e)
+        return app.finalize_request(rv)
+
+    async def call_wsgi(self, environ, receive, send, threads):
+        """
+        Run the Flask app on a thread of `threads`, sending its body as it is
+        produced (so /wait_for_result's event stream still streams). Each
+        step runs in the same copied context, where Flask keeps the request
+        context of streamed responses. If the client disconnects, the
+        callbacks the view left under DISCONNECT_CALLBACKS run and the body
+        is closed after the step in progress.
+        """
+        if not threads.claim():
+            return await self.refuse(environ, send, threads)
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+
+        def run(fn, *args):
+            return loop.run_in_executor(threads.executor, context.run, fn, *args)
+
+        async def send_start():
+            if not started.get('sent'):
+                started['sent'] = True
+                await send({'type': 'http.response.start', 'status': started['status'],
+                            'headers': asgi_headers(started['headers'])})
+
+        callbacks = environ[DISCONNECT_CALLBACKS] = DisconnectCallbacks()
+        disconnect = asyncio.create_task(self.wait_for_disconnect(receive, callbacks))
+        iterable = None
+        try:
+            iterable = await run(self.wsgi_app, environ, start_response)
+            chunks = iter(iterable)
+            while not callbacks.disconnected:
+                chunk = await run(next, chunks, None)
+                if chunk is None or callbacks.disconnected:
+                    break
+                if chunk:
+                    await send_start()
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            try:
+                if hasattr(iterable, 'close'):
+                    await run(iterable.close)
+            finally:
+                disconnect.cancel()
+                threads.release()
+        if not callbacks.disconnected:
+            await send_start()
+            await send({'type': 'http.response.body', 'body': b''})
+
+    async def wait_for_disconnect(self, receive, callbacks):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        callbacks.disconnect()
+
+    async def refuse(self, environ, send, threads):
+        """503 for a request whose thread pool is busy, with the Flask app's logging and after_request hooks."""
+        with self.wsgi_app.request_context(environ):
+            response = refuse_request(503, 'Too many requests in progress, retry shortly',
+                                      f'Request shed: all {threads.name} threads busy')
+            response.headers['Retry-After'] = str(self.wsgi_app.config['ADMISSION_RETRY_AFTER'])
+            response = self.wsgi_app.process_response(response)
+            await send({
+                'type': 'http.response.start',
+                'status': response.status_code,
+                'headers': asgi_headers(response.get_wsgi_headers(environ).to_wsgi_list()),
+            })
+            await send({'type': 'http.response.body', 'body': b''.join(response.get_app_iter(environ))})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.wsgi_app.config['SCHEMA_CHECK']:
+                    # Done once here, so no request runs the blocking check on the loop
+                    await asyncio.to_thread(self.check_schema)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for engine in [async_engine, *replica_engines.values()]:
+                    await engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def check_schema(self):
+        with self.wsgi_app.app_context():
+            check_schema_version()
+
+
+app = LeadAPI(flask_app, ASYNC_ROUTES)
@@ -0,0 +1,127 @@
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+
+
+class AsyncLogHandler(logging.Handler):
+    """
+    Logging handler that takes formatting and writing off the caller.
+
+    emit() only puts the record on a bounded queue; a background writer
+    takes records off in batches, formats them with this handler's formatter
+    and writes each batch with a single write() + flush(). When the queue is
+    full the record is dropped and counted instead of blocking the request,
+    and the writer reports the drops in its next batch.
+
+    Records must not be mutated after they are logged: the extra dicts
+    are formatted later, on the writer.
+    """
+
+    def __init__(self, stream=None, queue_size=10000, batch_size=256):
+        super().__init__()
+        self.stream = stream if stream is not None else sys.stderr
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self._reported_drops = 0
+        self._write_lock = threading.Lock()
+        self._writer = None
+        self._writer_pid = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def emit(self, record):
+        self._ensure_writer()
+        try:
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Write out everything queued so far, on the calling thread (used at exit)."""
+        while True:
+            batch = self._take_batch(block=False)
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self):
+        self.flush()
+        super().close()
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "batches": self.batches,
+        }
+
+    def _after_fork(self):
+        # The process forked after the first record (e.g. gunicorn --preload):
+        # the writer thread is gone, the queue's condition still lists it as
+        # a waiter (a put would wake only that), and its records are the
+        # parent's to write. Start over with a fresh queue and lock.
+        self.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self._write_lock = threading.Lock()
+        self._writer = None
+
+    def _ensure_writer(self):
+        if self._writer is None or self._writer_pid != os.getpid() or not self._writer.is_alive():
+            with self._write_lock:
+                if self._writer is None or self._writer_pid != os.getpid() or not self._writer.is_alive():
+                    self._writer = threading.Thread(target=self._run, name='async-log-writer', daemon=True)
+                    self._writer_pid = os.getpid()
+                    self._writer.start()
+
+    def _run(self):
+        while True:
+            batch = self._take_batch(block=True)
+            try:
+                self._write(batch)
+            except Exception:
+                time.sleep(0.1)  # never let a broken stream kill the writer
+
+    def _take_batch(self, block):
+        batch = []
+        try:
+            batch.append(self.queue.get(block=block))
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, batch):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        dropped = self.dropped
+        if dropped > self._reported_drops:
+            lines.append(self.format(logging.makeLogRecord({
+                "name": __name__,
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": "Log records dropped: queue full",
+                "dropped": dropped - self._reported_drops,
+                "dropped_total": dropped,
+            })))
+            self._reported_drops = dropped
+        if not lines:
+            return
+        with self._write_lock:
+            self.stream.write('\n'.join(lines) + '\n')
+            self.stream.flush()
+        self.written += len(batch)
+        self.batches += 1
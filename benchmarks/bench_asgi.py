@@ -0,0 +1,129 @@
+"""
+Side-by-side load test of the two ways to serve the lead API:
+`gunicorn -w N -k gevent app:app` (Procfile) and
+`gunicorn -w N -k uvicorn.workers.UvicornWorker asgi:app` (asgi.py).
+
+    python benchmarks/bench_asgi.py [--workers 4] [--concurrency 1,8,32,128] [--duration 10]
+                                    [--size 20000] [--leads 200] [--write-ratio 0.1]
+
+Each server is started in turn on the same database and driven by
+--concurrency client threads for --duration seconds per level, with a mix of
+/get_user reads (cache hits and ETag revalidations included, as in
+production) and /insert_user writes. Prints requests/s, p50 / p99 latency
+and errors per server and level. The client runs on this machine too, so
+compare the two servers with each other rather than with production.
+"""
+import argparse
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+from common import REPO_ROOT, percentile, random_email, report_markdown
+
+SERVERS = {
+    'gunicorn-gevent': lambda workers, port: [
+        sys.executable, '-m', 'gunicorn', '-w', str(workers), '-k', 'gevent', '-b', f'127.0.0.1:{port}', 'app:app'],
+    'uvicorn-asgi': lambda workers, port: [
+        sys.executable, '-m', 'gunicorn', '-w', str(workers), '-k', 'uvicorn.workers.UvicornWorker',
+        '-b', f'127.0.0.1:{port}', 'asgi:app'],
+}
+
+
+def start_server(name, workers, port, timeout=60):
+    server = subprocess.Popen(SERVERS[name](workers, port), cwd=REPO_ROOT, env=dict(os.environ, LOG_ASYNC='1'),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            requests.post(f'http://127.0.0.1:{port}/get_user', json={'user_email': 'warmup@bench.testing.com'},
+                          timeout=timeout)
+            return server
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError(f'{name} did not answer within {timeout} s')
+
+
+def run_level(base_url, leads, concurrency, duration, write_ratio, size):
+    """(requests/s, p50 s, p99 s, errors) for `concurrency` clients over `duration` seconds."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+
+    def client(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        etags = {}
+        mine, failed = [], 0
+        while time.perf_counter() < stop:
+            email = rng.choice(leads)
+            start = time.perf_counter()
+            try:
+                if rng.random() < write_ratio:
+                    response = session.post(f'{base_url}/insert_user', json={
+                        'user_email': email, 'text': report_markdown(size, rng)})
+                    ok = response.status_code in (200, 201)
+                else:
+                    headers = {'If-None-Match': etags[email]} if email in etags and rng.random() < 0.5 else {}
+                    response = session.post(f'{base_url}/get_user', json={'user_email': email}, headers=headers)
+                    ok = response.status_code in (200, 304)
+                    if response.status_code == 200:
+                        etags[email] = response.headers.get('ETag')
+            except requests.RequestException:
+                ok = False
+            mine.append(time.perf_counter() - start)
+            failed += not ok
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(seed,)) for seed in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return len(latencies) / elapsed, percentile(latencies, 50), percentile(latencies, 99), errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', default='1,8,32,128')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per concurrency level')
+    parser.add_argument('--size', type=int, default=20000, help='Report markdown size in characters')
+    parser.add_argument('--leads', type=int, default=200)
+    parser.add_argument('--write-ratio', type=float, default=0.1)
+    parser.add_argument('--servers', default=','.join(SERVERS))
+    parser.add_argument('--port', type=int, default=5098)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    leads = [random_email(rng) for _ in range(args.leads)]
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    print(f"{'server':<16} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for name in args.servers.split(','):
+        server = start_server(name, args.workers, args.port)
+        base_url = f'http://127.0.0.1:{args.port}'
+        try:
+            session = requests.Session()
+            for email in leads:  # every lead exists before the timed runs
+                session.post(f'{base_url}/insert_user', json={'user_email': email, 'text': report_markdown(args.size, rng)})
+            for concurrency in levels:
+                rate, p50, p99, errors = run_level(base_url, leads, concurrency, args.duration, args.write_ratio, args.size)
+                print(f"{name:<16} {concurrency:>7} {rate:>8.1f} {p50 * 1000:>8.1f} {p99 * 1000:>8.1f} {errors:>6}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
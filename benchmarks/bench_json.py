@@ -0,0 +1,73 @@
+"""
+Encode / decode time of ResultsTwo records with the stdlib json module and
+with orjson, through json_codec.FastJSONProvider as the app uses it.
+
+    python benchmarks/bench_json.py [--sizes 2000,100000,250000,500000] [--repeat 20]
+
+Encode is jsonify() of a /get_user_two payload (report text plus every audio
+column); decode is parsing an /insert_user_two request body. The accented
+rows add some non-ASCII characters to the report; ensure_ascii has to
+escape those, so their encode goes to the stdlib on both sides. Every
+orjson result is checked against the stdlib's before it is timed.
+"""
+import argparse
+import random
+
+from flask import Flask
+
+from common import random_email, timed
+from load_suite import Payloads
+
+from json_codec import FastJSONProvider, orjson
+
+
+def records(size, accented, rng):
+    payloads = Payloads(rng.random(), size, size + 1, leads=1, pool_size=1)
+    if accented:
+        payloads.texts = [text.replace('value', 'valeur é').replace('brand', 'marque “®”') for text in payloads.texts]
+    email = random_email(rng)
+    body = payloads.results_two(rng, email)
+    response = {
+        "success": True,
+        **body,
+        "length": len(body['text']),
+    }
+    return response, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='2000,100000,250000,500000', help='Report text sizes in characters')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    if orjson is None:
+        parser.error("orjson is not installed")
+
+    fast_app, stdlib_app = Flask('orjson'), Flask('stdlib')
+    fast, stdlib = FastJSONProvider(fast_app, codec='orjson'), FastJSONProvider(stdlib_app, codec='stdlib')
+    rng = random.Random(42)
+
+    print(f"{'size':>8} {'text':<9} {'encode ms':>10} {'orjson':>8} {'x':>5}  {'decode ms':>10} {'orjson':>8} {'x':>5}")
+    for size in (int(size) for size in args.sizes.split(',')):
+        for accented in (False, True):
+            response, body = records(size, accented, rng)
+            raw = stdlib.dumps(body)
+            with fast_app.app_context():
+                fast_bytes = fast.response(response).get_data()
+            with stdlib_app.app_context():
+                assert fast_bytes == stdlib.response(response).get_data()
+            assert fast.loads(raw) == stdlib.loads(raw)
+
+            with stdlib_app.app_context():
+                stdlib_encode = timed(lambda: stdlib.response(response).get_data(), repeat=args.repeat)
+            with fast_app.app_context():
+                fast_encode = timed(lambda: fast.response(response).get_data(), repeat=args.repeat)
+            stdlib_decode = timed(stdlib.loads, raw, repeat=args.repeat)
+            fast_decode = timed(fast.loads, raw, repeat=args.repeat)
+            print(f"{len(fast_bytes):>8} {'accented' if accented else 'ascii':<9} "
+                  f"{stdlib_encode * 1000:>10.3f} {fast_encode * 1000:>8.3f} {stdlib_encode / fast_encode:>5.1f}  "
+                  f"{stdlib_decode * 1000:>10.3f} {fast_decode * 1000:>8.3f} {stdlib_decode / fast_decode:>5.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Throughput of markdown_to_html: the original three-regex pipeline vs the
+single-pass renderer in markdown_render.py, cold and memoized.
+
+    python benchmarks/bench_markdown.py [--sizes 2000,50000,200000,500000]
+"""
+import argparse
+import random
+import re
+
+from common import report_markdown, timed
+
+from markdown_render import MarkdownRenderer, render_markdown
+
+
+def legacy_markdown_to_html(text):
+    """The implementation app.py shipped before markdown_render.py."""
+    text = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', text)
+    text = re.sub(r'### (.*)', r'<h3 class="text-xl font-bold mb-2">\1</h3>', text)
+    text = re.sub(r'## (.*)', r'<h2 class="text-2xl font-bold mb-4">\1</h2>', text)
+    text = text.replace('\n', '<br>')
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='2000,50000,200000,500000')
+    parser.add_argument('--number', type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    renderer = MarkdownRenderer()
+    print(f"{'size':>10} {'legacy MB/s':>12} {'single-pass MB/s':>17} {'memoized MB/s':>14} {'speedup':>8}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        text = report_markdown(size, rng)
+        assert render_markdown(text) == legacy_markdown_to_html(text), 'outputs differ'
+        megabytes = len(text.encode()) / 1e6
+
+        legacy = timed(legacy_markdown_to_html, text, number=args.number)
+        single = timed(render_markdown, text, number=args.number)
+        renderer(text)  # warm the render cache
+        memo = timed(renderer, text, number=args.number)
+        print(f"{size:>10} {megabytes / legacy:>12.1f} {megabytes / single:>17.1f} "
+              f"{megabytes / memo:>14.1f} {legacy / single:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Bytes on the wire and read latency of /get_user and /get_user_two for a
+typical ~100 KB report, per Accept-Encoding, against a running server.
+
+    python app.py &
+    python benchmarks/bench_responses.py [--base-url http://127.0.0.1:5001] [--size 100000] [--reads 500]
+
+Start the server with RESPONSE_COMPRESSION=0 for the uncompressed baseline,
+and with LEAD_CACHE_TTL=30 to include the read cache (off by default).
+"""
+import argparse
+import random
+import time
+
+import requests
+
+from common import percentile, random_email, report_markdown
+
+CODINGS = ['identity', 'gzip', 'br']
+
+
+def measure(session, url, body, coding, reads):
+    latencies = []
+    wire_bytes = 0
+    for _ in range(reads):
+        start = time.perf_counter()
+        response = session.post(url, json=body, headers={'Accept-Encoding': coding}, stream=True)
+        raw = response.raw.read(decode_content=False)  # exactly what crossed the wire
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+        wire_bytes = len(raw)
+        served = response.headers.get('Content-Encoding', 'identity')
+    return served, wire_bytes, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:5001')
+    parser.add_argument('--size', type=int, default=100000, help='Report markdown size in characters')
+    parser.add_argument('--reads', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    session = requests.Session()
+    email = random_email(rng)
+    report = report_markdown(args.size, rng)
+    session.post(f'{args.base_url}/insert_user', json={'user_email': email, 'text': report}).raise_for_status()
+    session.post(f'{args.base_url}/insert_user_two', json={
+        'user_email': email, 'text': report,
+        'salesletter': report_markdown(args.size // 2, rng), 'email_1': report_markdown(5000, rng),
+    }).raise_for_status()
+
+    print(f"{'endpoint':<14} {'asked':>9} {'served':>9} {'wire bytes':>11} {'p50 ms':>8} {'p99 ms':>8}")
+    for endpoint in ('get_user', 'get_user_two'):
+        url = f'{args.base_url}/{endpoint}'
+        for coding in CODINGS:
+            measure(session, url, {'user_email': email}, coding, 5)  # warm the caches
+            served, wire_bytes, latencies = measure(session, url, {'user_email': email}, coding, args.reads)
+            print(f"{endpoint:<14} {coding:>9} {served:>9} {wire_bytes:>11} "
+                  f"{percentile(latencies, 50) * 1000:>8.2f} {percentile(latencies, 99) * 1000:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
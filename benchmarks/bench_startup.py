@@ -0,0 +1,65 @@
+"""
+Boot cost of the app: module import time and gunicorn time-to-first-request.
+
+    python benchmarks/bench_startup.py [--workers 4] [--runs 5] [--app-dir .]
+
+Time-to-first-request runs from spawning gunicorn until the first 200 from
+/metrics. Point --app-dir at another checkout (e.g. a `git worktree` of an
+older commit) to compare it against this one on the same database.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import requests
+
+from common import REPO_ROOT, percentile
+
+IMPORT_SNIPPET = 'import time; start = time.perf_counter(); import app; print(time.perf_counter() - start)'
+
+
+def import_time(app_dir):
+    output = subprocess.run([sys.executable, '-c', IMPORT_SNIPPET], cwd=app_dir, env=dict(os.environ, LOG_ASYNC='0'),
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def first_request_time(app_dir, workers, port, timeout=60):
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-k', 'gevent', '-b', f'127.0.0.1:{port}', 'app:app'],
+        cwd=app_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                if requests.get(f'http://127.0.0.1:{port}/metrics', timeout=timeout).status_code == 200:
+                    return time.perf_counter() - start
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.01)
+        raise RuntimeError(f'No response within {timeout} s')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app-dir', default=REPO_ROOT)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    imports = [import_time(args.app_dir) for _ in range(args.runs)]
+    boots = [first_request_time(args.app_dir, args.workers, args.port) for _ in range(args.runs)]
+    print(f"{'':<24} {'p50 ms':>8} {'max ms':>8}")
+    print(f"{'import app':<24} {percentile(imports, 50) * 1000:>8.1f} {max(imports) * 1000:>8.1f}")
+    print(f"{f'first request (-w {args.workers})':<24} {percentile(boots, 50) * 1000:>8.1f} {max(boots) * 1000:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Shared helpers for the scripts in benchmarks/ (payload generation, timing, stats)."""
+import os
+import random
+import string
+import sys
+import time
+
+# Let `python benchmarks/<script>.py` import the app modules from the repo root.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+_WORDS = [
+    'growth', 'pipeline', 'offer', 'audience', 'conversion', 'strategy', 'revenue', 'brand',
+    'customer', 'funnel', 'campaign', 'insight', 'market', 'value', 'leads', 'retention',
+]
+
+
+def random_email(rng=random):
+    name = ''.join(rng.choices(string.ascii_lowercase, k=12))
+    return f'{name}@bench.testing.com'
+
+
+def report_markdown(size, rng=random):
+    """
+    LLM-style report markdown of roughly `size` characters: ## / ### headings,
+    **bold** phrases and short paragraphs, like the bodies the pipeline posts.
+    """
+    parts = []
+    length = 0
+    while length < size:
+        roll = rng.random()
+        if roll < 0.05:
+            line = '## ' + ' '.join(rng.choices(_WORDS, k=4)).title()
+        elif roll < 0.15:
+            line = '### ' + ' '.join(rng.choices(_WORDS, k=5)).title()
+        else:
+            words = rng.choices(_WORDS, k=rng.randint(12, 40))
+            for _ in range(rng.randint(0, 2)):
+                i = rng.randrange(len(words))
+                words[i] = f'**{words[i]}**'
+            line = ' '.join(words) + '.'
+        parts.append(line)
+        parts.append('')
+        length += len(line) + 2
+    return '\n'.join(parts)[:size]
+
+
+def timed(fn, *args, repeat=5, number=1):
+    """Best-of-`repeat` wall time in seconds for `number` calls of fn(*args)."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn(*args)
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers (pct in 0-100)."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
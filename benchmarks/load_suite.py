@@ -0,0 +1,369 @@
+"""
+Load suite for every route: throughput and p50 / p95 / p99 latency per
+route and concurrency level, written to JSON for diffing across commits.
+
+    # in-process, through the Flask test client (DATABASE_URL / DB_DRIVER as for the app)
+    python benchmarks/load_suite.py --output before.json
+
+    # against a running server (python app.py, gunicorn, asgi.py, ...)
+    python benchmarks/load_suite.py --base-url http://127.0.0.1:5001 --output after.json
+
+    # flag routes whose p95 or throughput got worse by more than 20 %
+    python benchmarks/load_suite.py --output after.json --compare before.json --threshold 0.2
+
+    options: [--concurrency 1,8,32] [--requests 200] [--routes get_user,insert_user_two]
+             [--min-size 2000] [--max-size 500000] [--leads 50] [--seed 42]
+
+Payloads are reproducible for a given --seed: report texts are LLM-style
+markdown of 2 KB to 500 KB (log-uniform), /insert_user_two and /insert_audio
+send every audio column, and reads pick from --leads rows seeded per table
+before the timed runs. Writes overwrite those rows, so repeated runs do
+not grow the tables. With --compare the exit status is 1 when a route
+regressed, so it can gate a deploy.
+
+In-process runs default LOG_SUCCESS_SAMPLE_RATE to 0 to keep the app's
+request logs off the terminal, and LEAD_CACHE_TTL to 30 so the get_* routes
+measure the read cache (off by default in the app; one process, so the
+local backend is consistent). Start a server with LEAD_CACHE_TTL set (and
+LEAD_CACHE_BACKEND=redis for several workers) to measure it there; the
+TTL in effect is recorded in the results.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timezone
+
+import requests
+
+from common import REPO_ROOT, percentile, random_email, report_markdown
+
+# Columns /insert_user_two and /insert_audio replicate (app.AUDIO_FIELDS),
+# with the kind of value the pipeline sends for each
+SHORT_FIELDS = [
+    'exit_message', 'headline', 'company_name', 'Industry', 'Products_services', 'primary_goal',
+    'target_audience', 'offer_name', 'offer_price', 'offer_goal', 'Offer_topic', 'user_name',
+]
+URL_FIELDS = ['audio_link', 'audio_link_two', 'target_url', 'website_url', 'offer_url']
+LONG_FIELDS = [
+    'Business_description', 'pain_points', 'offer_description', 'primary_benefits', 'testimonials',
+    'email_1', 'email_2', 'salesletter',
+]
+
+# /get_users table name -> (insert route, get route)
+TABLES = {
+    'user': ('/insert_user', '/get_user'),
+    'user_psych': ('/insert_user_psych', '/get_user_psych'),
+    'user_one': ('/insert_user_one', '/get_user_one'),
+    'user_two': ('/insert_user_two', '/get_user_two'),
+    'audio': ('/insert_audio', None),
+}
+
+
+class Payloads:
+    """Seeded request bodies: a pool of report texts and the seeded lead emails of each table."""
+
+    def __init__(self, seed, min_size, max_size, leads, pool_size=16):
+        rng = random.Random(seed)
+        sizes = [int(math.exp(rng.uniform(math.log(min_size), math.log(max_size)))) for _ in range(pool_size)]
+        self.texts = [report_markdown(size, rng) for size in sizes]
+        self.leads = {table: [random_email(rng) for _ in range(leads)] for table in TABLES}
+
+    def text(self, rng):
+        return rng.choice(self.texts)
+
+    def audio_fields(self, rng, email):
+        fields = {name: ' '.join(rng.choice(self.texts)[:400].split()[:rng.randint(2, 12)]) for name in SHORT_FIELDS}
+        fields.update({name: f'https://cdn.example.com/{name}/{rng.getrandbits(64):x}' for name in URL_FIELDS})
+        fields.update({name: rng.choice(self.texts)[:rng.randint(1000, 20000)] for name in LONG_FIELDS})
+        fields['lead_email'] = email
+        return fields
+
+    def text_lead(self, rng, email):
+        return {
+            'user_email': email,
+            'text': self.text(rng),
+            'booking_button_name': 'Book a call',
+            'booking_button_redirection': 'https://calendly.com/example/intro',
+        }
+
+    def results_two(self, rng, email):
+        return {**self.text_lead(rng, email), **self.audio_fields(rng, email)}
+
+    def audio(self, rng, email):
+        return {'user_email': email, **self.audio_fields(rng, email)}
+
+
+# ------------------------------------------------------------------
+# Scenarios: route -> (build one request, accepted statuses). A request is
+# a dict of method, path and optional json / data / params / headers.
+# ------------------------------------------------------------------
+def insert(path, table, body, **extra):
+    return lambda p, rng: {'method': 'POST', 'path': path, 'json': body(p, rng, rng.choice(p.leads[table])), **extra}
+
+
+def get(path, table, **extra):
+    return lambda p, rng: {'method': 'POST', 'path': path, 'json': {'user_email': rng.choice(p.leads[table])}, **extra}
+
+
+def batch(path, table, body, size=20):
+    return lambda p, rng: {'method': 'POST', 'path': path,
+                           'json': [body(p, rng, email) for email in rng.sample(p.leads[table], size)]}
+
+
+def stream(path, table):
+    return lambda p, rng: {'method': 'POST', 'path': path, 'params': {'user_email': rng.choice(p.leads[table])},
+                           'data': urllib.parse.quote(p.text(rng)).encode()}
+
+
+WRITES = (200, 201)
+# Write-behind ingest (INGEST_ASYNC=prefer, the default)
+RESPOND_ASYNC = {'headers': {'Prefer': 'respond-async'}}
+SCENARIOS = {
+    'insert_user': (insert('/insert_user', 'user', Payloads.text_lead), WRITES),
+    'insert_user_psych': (insert('/insert_user_psych', 'user_psych', Payloads.text_lead), WRITES),
+    'insert_user_one': (insert('/insert_user_one', 'user_one', Payloads.text_lead), WRITES),
+    'insert_user_two': (insert('/insert_user_two', 'user_two', Payloads.results_two), WRITES),
+    'insert_audio': (insert('/insert_audio', 'audio', Payloads.audio), WRITES),
+    'insert_user_two_async': (insert('/insert_user_two', 'user_two', Payloads.results_two, **RESPOND_ASYNC), (202,)),
+    'insert_audio_async': (insert('/insert_audio', 'audio', Payloads.audio, **RESPOND_ASYNC), (202,)),
+    'update_lead': (insert('/update_lead', 'user', Payloads.text_lead), (200,)),
+    'get_user': (get('/get_user', 'user'), (200,)),
+    'get_user_psych': (get('/get_user_psych', 'user_psych'), (200,)),
+    'get_user_one': (get('/get_user_one', 'user_one'), (200,)),
+    'get_user_two': (get('/get_user_two', 'user_two'), (200,)),
+    'get_user_two_fields': (get('/get_user_two', 'user_two', params={'fields': 'headline,audio_link,length'}), (200,)),
+    'get_audio': (lambda p, rng: {'method': 'GET', 'path': '/get_audio',
+                                  'params': {'user_email': rng.choice(p.leads['audio'])}}, (200,)),
+    'get_users': (lambda p, rng: {'method': 'POST', 'path': '/get_users',
+                                  'json': {'table': 'user_two', 'emails': rng.sample(p.leads['user_two'], 20)}}, (200,)),
+    'wait_for_result': (lambda p, rng: {'method': 'GET', 'path': '/wait_for_result',
+                                        'params': {'user_email': rng.choice(p.leads['user_two']), 'timeout': 0}}, (200,)),
+    'insert_user_batch': (batch('/insert_user/batch', 'user', Payloads.text_lead), (200,)),
+    'insert_user_psych_batch': (batch('/insert_user_psych/batch', 'user_psych', Payloads.text_lead), (200,)),
+    'insert_user_one_batch': (batch('/insert_user_one/batch', 'user_one', Payloads.text_lead), (200,)),
+    'insert_user_two_batch': (batch('/insert_user_two/batch', 'user_two', Payloads.results_two), (200,)),
+    'insert_audio_batch': (batch('/insert_audio/batch', 'audio', Payloads.audio), (200,)),
+    'insert_user_stream': (stream('/insert_user/stream', 'user'), WRITES),
+    'insert_user_psych_stream': (stream('/insert_user_psych/stream', 'user_psych'), WRITES),
+    'insert_user_one_stream': (stream('/insert_user_one/stream', 'user_one'), WRITES),
+    'insert_user_two_stream': (stream('/insert_user_two/stream', 'user_two'), WRITES),
+    'cache_stats': (lambda p, rng: {'method': 'GET', 'path': '/cache_stats'}, (200,)),
+    'log_stats': (lambda p, rng: {'method': 'GET', 'path': '/log_stats'}, (200,)),
+    'metrics': (lambda p, rng: {'method': 'GET', 'path': '/metrics'}, (200,)),
+    'ingest_status': (lambda p, rng: {'method': 'GET', 'path': '/ingest_status'}, (200,)),
+}
+
+
+# ------------------------------------------------------------------
+# Targets: a factory of per-thread senders, send(request) -> status code.
+# ------------------------------------------------------------------
+class ServerTarget:
+    def __init__(self, base_url):
+        self.name = base_url
+
+    def sender(self):
+        session = requests.Session()
+
+        def send(req):
+            response = session.request(req['method'], self.name + req['path'], json=req.get('json'),
+                                       data=req.get('data'), params=req.get('params'), headers=req.get('headers'))
+            return response.status_code
+        return send
+
+
+class TestClientTarget:
+    name = 'flask-test-client'
+
+    def __init__(self):
+        os.environ.setdefault('LOG_SUCCESS_SAMPLE_RATE', '0')
+        os.environ.setdefault('LEAD_CACHE_TTL', '30')
+        from app import app
+        self.app = app
+
+    def sender(self):
+        client = self.app.test_client()
+
+        def send(req):
+            response = client.open(req['path'], method=req['method'], json=req.get('json'), data=req.get('data'),
+                                   query_string=req.get('params'), headers=req.get('headers'))
+            response.close()
+            return response.status_code
+        return send
+
+
+def route_rules(app):
+    return {rule.rule for rule in app.url_map.iter_rules() if rule.endpoint != 'static'}
+
+
+def run_scenario(target, payloads, build, accepted, concurrency, total, seed):
+    """Stats of `total` requests from `concurrency` threads."""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    remaining = [total]
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        send = target.sender()
+        mine, failed = [], 0
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            req = build(payloads, rng)
+            start = time.perf_counter()
+            try:
+                ok = send(req) in accepted
+            except requests.RequestException:
+                ok = False
+            mine.append(time.perf_counter() - start)
+            failed += not ok
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'throughput': len(latencies) / elapsed,
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def seed_leads(target, payloads, seed):
+    """Write every seeded lead once, so reads and overwrites find their rows."""
+    rng = random.Random(seed)
+    send = target.sender()
+    builders = {'user_two': Payloads.results_two, 'audio': Payloads.audio}
+    for table, (path, _) in TABLES.items():
+        body = builders.get(table, Payloads.text_lead)
+        for email in payloads.leads[table]:
+            status = send({'method': 'POST', 'path': path, 'json': body(payloads, rng, email)})
+            if status not in WRITES:
+                raise RuntimeError(f'Seeding {path} failed with {status}')
+
+
+def lead_cache_ttl(target):
+    """The target's LEAD_CACHE_TTL, from /cache_stats (None if it can't be read)."""
+    if isinstance(target, TestClientTarget):
+        return target.app.config['LEAD_CACHE_TTL']
+    try:
+        return requests.get(f'{target.name}/cache_stats', timeout=5).json().get('ttl')
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def run_metadata(target, args):
+    def git(*command):
+        try:
+            return subprocess.run(['git', *command], cwd=REPO_ROOT, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'target': target.name,
+        'python': platform.python_version(),
+        'db_driver': os.environ.get('DB_DRIVER', 'pg8000'),
+        'lead_cache_ttl': lead_cache_ttl(target),
+        'args': vars(args),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print the changes against `baseline`; returns the regressions."""
+    regressions = []
+    print(f"\n{'route':<26} {'clients':>7} {'p95 ms':>16} {'req/s':>16}")
+    for route, levels in results['routes'].items():
+        for clients, stats in levels.items():
+            before = baseline.get('routes', {}).get(route, {}).get(clients)
+            if before is None:
+                continue
+            p95_change = stats['p95_ms'] / before['p95_ms'] - 1
+            rate_change = stats['throughput'] / before['throughput'] - 1
+            regressed = p95_change > threshold or rate_change < -threshold
+            if regressed:
+                regressions.append((route, clients))
+            print(f"{route:<26} {clients:>7} {before['p95_ms']:>7.1f} {p95_change:>+7.0%} "
+                  f"{before['throughput']:>7.1f} {rate_change:>+7.0%}{'  REGRESSED' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', help='Server to load; default: the Flask test client in-process')
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per route and concurrency level')
+    parser.add_argument('--warmup', type=int, default=10, help='Untimed requests per route first')
+    parser.add_argument('--routes', help='Comma-separated scenario names (default: all)')
+    parser.add_argument('--min-size', type=int, default=2000, help='Smallest report text, characters')
+    parser.add_argument('--max-size', type=int, default=500000, help='Largest report text, characters')
+    parser.add_argument('--leads', type=int, default=50, help='Seeded rows per table (at least 20)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the results here as JSON')
+    parser.add_argument('--compare', help='Earlier --output to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed p95 / throughput change')
+    args = parser.parse_args()
+
+    routes = args.routes.split(',') if args.routes else list(SCENARIOS)
+    unknown = [route for route in routes if route not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(unknown)}")
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    payloads = Payloads(args.seed, args.min_size, args.max_size, max(args.leads, 20))
+    target = ServerTarget(args.base_url.rstrip('/')) if args.base_url else TestClientTarget()
+    if isinstance(target, TestClientTarget):
+        covered = {build(payloads, random.Random(0))['path'] for build, _ in SCENARIOS.values()}
+        missing = route_rules(target.app) - covered
+        if missing:
+            print(f"Routes without a scenario: {', '.join(sorted(missing))}", file=sys.stderr)
+
+    results = {'meta': run_metadata(target, args), 'routes': {}}
+    seed_leads(target, payloads, args.seed)
+
+    print(f"{'route':<26} {'clients':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for route in routes:
+        build, accepted = SCENARIOS[route]
+        if args.warmup:
+            run_scenario(target, payloads, build, accepted, 1, args.warmup, args.seed)
+        for concurrency in levels:
+            stats = run_scenario(target, payloads, build, accepted, concurrency, args.requests, args.seed)
+            results['routes'].setdefault(route, {})[str(concurrency)] = stats
+            print(f"{route:<26} {concurrency:>7} {stats['throughput']:>8.1f} {stats['p50_ms']:>8.1f} "
+                  f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['errors']:>6}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import zlib
+
+from sqlalchemy import LargeBinary, Text
+from sqlalchemy.types import TypeDecorator
+
+# First byte of every stored value says how the rest is encoded, so the
+# codec or level can change at any time without rewriting old rows.
+FORMAT_RAW = 0
+FORMAT_ZLIB = 1
+FORMAT_ZSTD = 2
+
+CODECS = {'none': FORMAT_RAW, 'zlib': FORMAT_ZLIB, 'zstd': FORMAT_ZSTD}
+DEFAULT_LEVELS = {'none': 0, 'zlib': 6, 'zstd': 3}
+
+
+def _zstandard():
+    try:
+        import zstandard  # only needed when zstd is configured or present in the data
+    except ImportError:
+        raise RuntimeError("TEXT_COMPRESSION=zstd needs the 'zstandard' package") from None
+    return zstandard
+
+
+def _compressor(fmt, level):
+    """A streaming compressor with zlib's compress()/flush() interface."""
+    if fmt == FORMAT_ZLIB:
+        return zlib.compressobj(level)
+    if fmt == FORMAT_ZSTD:
+        return _zstandard().ZstdCompressor(level=level).compressobj()
+    return None
+
+
+def decompress(blob):
+    """Stored bytes (format byte + payload) back to the UTF-8 text."""
+    blob = bytes(blob)
+    fmt, payload = blob[0], blob[1:]
+    if fmt == FORMAT_RAW:
+        data = payload
+    elif fmt == FORMAT_ZLIB:
+        data = zlib.decompress(payload)
+    elif fmt == FORMAT_ZSTD:
+        # Streaming writes leave the content size out of the frame header,
+        # so decompress through a decompressobj rather than the one-shot API.
+        data = _zstandard().ZstdDecompressor().decompressobj().decompress(payload)
+    else:
+        raise ValueError(f"Unknown compressed text format {fmt}")
+    return data.decode('utf-8')
+
+
+class CompressedText(TypeDecorator):
+    """
+    A text column stored as bytea: one format byte, then the UTF-8 text,
+    either raw or compressed with zlib / zstd.
+
+    Values shorter than `min_size` bytes are stored raw, since compressing
+    them costs more than it saves. Reads accept every format regardless of
+    the configured codec, so switching codecs (or turning compression down
+    to 'none') never needs a migration.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def __init__(self, codec='zlib', level=None, min_size=256):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown TEXT_COMPRESSION {codec!r}; expected one of {sorted(CODECS)}")
+        super().__init__()
+        self.codec = codec
+        self.level = DEFAULT_LEVELS[codec] if level is None else level
+        self.min_size = min_size
+        if CODECS[codec] == FORMAT_ZSTD:
+            _zstandard()  # fail at startup rather than on the first write
+
+    @property
+    def format(self):
+        return CODECS[self.codec]
+
+    def compress(self, value):
+        data = value.encode('utf-8')
+        if self.format == FORMAT_RAW or len(data) < self.min_size:
+            return bytes([FORMAT_RAW]) + data
+        compressor = _compressor(self.format, self.level)
+        return bytes([self.format]) + compressor.compress(data) + compressor.flush()
+
+    def iter_compressed(self, chunks):
+        """Streaming compress(): str chunks in, stored bytes out, in pieces."""
+        yield bytes([self.format])
+        compressor = _compressor(self.format, self.level)
+        for chunk in chunks:
+            data = chunk.encode('utf-8')
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+        if compressor:
+            yield compressor.flush()
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return self.compress(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return decompress(value)
+
+
+def large_text_type(codec=None, level=None, min_size=256):
+    """
+    Column type for the large report columns.
+
+    Without a codec they stay plain TEXT, exactly as before; with one they
+    become CompressedText (bytea), which needs `flask compress-text` to
+    convert the existing columns first.
+    """
+    if not codec:
+        return Text
+    return CompressedText(codec, level=level, min_size=min_size)
@@ -0,0 +1,133 @@
+import sys
+
+# DB_DRIVER -> SQLAlchemy dialect+driver prefix for DATABASE_URL
+DRIVERS = {
+    'pg8000': 'postgresql+pg8000',
+    'psycopg2': 'postgresql+psycopg2',
+    'psycopg': 'postgresql+psycopg',
+}
+DRIVER_ALIASES = {'psycopg3': 'psycopg'}
+
+
+def driver_name(driver):
+    driver = DRIVER_ALIASES.get(driver, driver)
+    if driver not in DRIVERS:
+        raise ValueError(f"Unknown DB_DRIVER {driver!r}; expected one of {', '.join(DRIVERS)}")
+    return driver
+
+
+def database_uri(url, driver):
+    """`url` (postgres://, postgresql:// or postgresql+<any driver>://) for the given DB_DRIVER."""
+    _, separator, rest = url.partition('://')
+    if not separator:
+        raise ValueError(f"Not a database URL: {url!r}")
+    return f'{DRIVERS[driver_name(driver)]}://{rest}'
+
+
+def gevent_patched():
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('socket')
+
+
+def install_gevent_support(driver):
+    """
+    Keep database I/O from blocking the gevent hub. Returns True when a hook
+    was installed.
+
+    pg8000 is pure Python and talks through the patched socket module, and
+    psycopg 3 picks a gevent-friendly wait function by itself when it is
+    imported after monkey-patching (gunicorn's gevent worker patches before
+    loading the app). psycopg2 waits inside libpq, so it needs a wait
+    callback that yields to the hub.
+    """
+    if driver_name(driver) != 'psycopg2':
+        return False
+    return install_psycopg2_wait_callback()
+
+
+def install_psycopg2_wait_callback():
+    """
+    The psycopg2 half of install_gevent_support(), for psycopg2 connections
+    made whatever DB_DRIVER is (lead_events' LISTEN connection). Returns True
+    when the callback was installed.
+    """
+    if not gevent_patched():
+        return False
+    from psycopg2 import extensions
+
+    extensions.set_wait_callback(_gevent_wait_callback)
+    return True
+
+
+def _gevent_wait_callback(connection, timeout=None):
+    from gevent.socket import wait_read, wait_write
+    from psycopg2 import OperationalError, extensions
+
+    while True:
+        state = connection.poll()
+        if state == extensions.POLL_OK:
+            return
+        if state == extensions.POLL_READ:
+            wait_read(connection.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(connection.fileno(), timeout=timeout)
+        else:
+            raise OperationalError(f"Bad result from poll: {state!r}")
+
+
+def connect_args(driver, pooler):
+    """Driver-specific DB-API connect() arguments."""
+    if driver_name(driver) == 'psycopg' and pooler == 'pgbouncer':
+        # psycopg 3 prepares named statements after 5 runs of a query; a
+        # transaction-mode pooler may run the next one on another server.
+        return {"prepare_threshold": None}
+    return {}
+
+
+def supports_copy(driver):
+    """
+    Whether copy_from_iterable() can stream into this driver's connections.
+    psycopg2 refuses COPY once a wait callback is set (i.e. under gevent).
+    """
+    if driver_name(driver) != 'psycopg2':
+        return True
+    from psycopg2 import extensions
+
+    return extensions.get_wait_callback() is None
+
+
+def copy_from_iterable(dbapi_connection, driver, sql, pieces):
+    """Run `sql` (a COPY ... FROM STDIN) feeding it the str `pieces` as they are produced."""
+    driver = driver_name(driver)
+    cursor = dbapi_connection.cursor()
+    try:
+        if driver == 'pg8000':
+            cursor.execute(sql, stream=pieces)
+        elif driver == 'psycopg':
+            with cursor.copy(sql) as copy:
+                for piece in pieces:
+                    copy.write(piece)
+        else:
+            cursor.copy_expert(sql, _IterableReader(pieces), size=64 * 1024)
+    finally:
+        cursor.close()
+
+
+class _IterableReader:
+    """Minimal file object over an iterable of str, for psycopg2's copy_expert()."""
+
+    def __init__(self, pieces):
+        self._pieces = iter(pieces)
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            piece = next(self._pieces, None)
+            if piece is None:
+                break
+            self._buffer += piece
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
@@ -0,0 +1,98 @@
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+from db_drivers import connect_args
+from metrics import add_phase
+
+
+class PoolWaitStats:
+    """Checkout counters shared by every TimedQueuePool of this process."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds += seconds
+            if seconds > self.max_wait_seconds:
+                self.max_wait_seconds = seconds
+            if timed_out:
+                self.timeouts += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds": self.wait_seconds,
+                "max_wait_seconds": self.max_wait_seconds,
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool that measures how long each checkout waits for a connection.
+
+    The wait covers queueing behind other greenlets for a pooled connection
+    and opening an overflow one. It is charged to the pool_wait phase of
+    the current request and added to the process-wide `wait_stats` (a class
+    attribute, so it survives the pool being recreated on dispose()).
+    """
+
+    wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.wait_stats.observe(waited, timed_out)
+            add_phase('pool_wait', waited)
+
+
+class TimedAsyncQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    """TimedQueuePool for create_async_engine() engines (asgi.py)."""
+
+
+def engine_options(pooler='app', driver='pg8000', pool_size=5, max_overflow=10, pool_timeout=10,
+                   pool_recycle=1800, pool_pre_ping=False, pool_use_lifo=False, asyncio=False):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the configured pooling mode.
+
+    'app' keeps a TimedQueuePool per worker process. 'pgbouncer' leaves
+    pooling to a PgBouncer in transaction mode: every checkout opens a
+    cheap client connection to the pooler (NullPool), so idle greenlets
+    hold no server connection. Transaction pooling hands each transaction
+    to whichever server connection is free, so named prepared statements
+    must stay off (see db_drivers.connect_args).
+
+    `asyncio` picks the pool class an AsyncEngine needs.
+    """
+    if pooler == 'pgbouncer':
+        return {"poolclass": NullPool, "pool_pre_ping": pool_pre_ping,
+                "connect_args": connect_args(driver, pooler)}
+    if pooler != 'app':
+        raise ValueError(f"Unknown DB_POOLER {pooler!r}; expected 'app' or 'pgbouncer'")
+    return {
+        "connect_args": connect_args(driver, pooler),
+        "poolclass": TimedAsyncQueuePool if asyncio else TimedQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        "pool_recycle": pool_recycle,
+        "pool_pre_ping": pool_pre_ping,
+        "pool_use_lifo": pool_use_lifo,
+    }
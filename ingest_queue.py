@@ -0,0 +1,325 @@
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    target TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT,
+    size INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created INTEGER,
+    enqueued_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS ingest_state ON ingest (state, id);
+"""
+
+
+class IngestSpool:
+    """
+    Write-behind queue for the insert endpoints, spooled to a local SQLite
+    database in WAL mode.
+
+    enqueue() stores one validated row and returns its ingest id once it is
+    on disk. Every worker of a dyno shares the spool file, and whichever of
+    them holds the flock on `<path>.lock` runs the committer: it takes the
+    oldest queued rows (up to batch_size / max_bytes, and stopping before a
+    second row for the same (target, key) so each group keeps the meaning of
+    sequential posts) and hands them to write_batch() as one group. Whatever
+    queues up while a group is being written goes into the next one, so
+    groups grow with the load while a lone row is written right away, and
+    a burst holds one database connection instead of one per request.
+
+    write_batch(entries) gets [(ingest_id, target, values)] in queue order,
+    must write them in one transaction and returns {ingest_id: created}.
+    If it raises one of `retryable` (the database is unreachable) the group
+    is retried as a whole after a backoff. Any other error is retried row by
+    row so one bad row can't hold up the rest, and a row that still fails
+    after max_attempts is marked failed. Committed and failed rows are kept,
+    committed ones without their values, for `retention` seconds so that
+    status() can answer for them.
+
+    Delivery is at least once: a process dying between the database commit
+    and marking the group committed writes it again on restart. The spool
+    lives on local disk, so it survives worker restarts but not the machine
+    going away; close() drains it before the process exits. For the same
+    reason it runs with synchronous=NORMAL, which in WAL mode loses nothing
+    when the process crashes.
+    """
+
+    def __init__(self, path, write_batch, batch_size=200, max_bytes=32 * 1024 * 1024, max_attempts=5,
+                 retention=3600.0, poll_interval=0.05, retryable=(), logger=None):
+        self.path = path
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.retryable = tuple(retryable)
+        self.logger = logger
+        self.enqueued = 0
+        self.groups = 0
+        self.committed = 0
+        self.failed = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._connection = None
+        self._pid = None
+        self._leader_file = None
+        self._leader_pid = None
+        self._thread = None
+        self._last_prune = 0.0
+
+    def enqueue(self, target, key, values):
+        """Spool one row for `target` (key: its upsert key); returns the ingest id."""
+        payload = json.dumps(values)
+        with self._lock:
+            cursor = self._db().execute(
+                "INSERT INTO ingest (target, key, payload, size, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+                (target, key, payload, len(payload), time.time()),
+            )
+        self.enqueued += 1
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    def status(self, ingest_id):
+        """What became of one enqueued row, or None once it has expired (or never was)."""
+        with self._lock:
+            row = self._db().execute(
+                "SELECT target, state, attempts, error, created, enqueued_at, finished_at FROM ingest WHERE id = ?",
+                (ingest_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        target, state, attempts, error, created, enqueued_at, finished_at = row
+        status = {"ingest_id": ingest_id, "table": target, "status": state, "attempts": attempts,
+                  "enqueued_at": enqueued_at}
+        if state == 'committed':
+            status["action"] = 'added' if created else 'overwritten'
+            status["committed_at"] = finished_at
+        elif state == 'failed':
+            status["error"] = error
+            status["failed_at"] = finished_at
+        elif error:
+            status["error"] = error
+        return status
+
+    def pending(self):
+        with self._lock:
+            return self._db().execute("SELECT count(*) FROM ingest WHERE state = 'queued'").fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            db = self._db()
+            counts = dict(db.execute("SELECT state, count(*) FROM ingest GROUP BY state").fetchall())
+            oldest = db.execute("SELECT min(enqueued_at) FROM ingest WHERE state = 'queued'").fetchone()[0]
+        return {
+            "queued": counts.get('queued', 0),
+            "oldest_queued_seconds": round(time.time() - oldest, 3) if oldest is not None else 0,
+            "committed_retained": counts.get('committed', 0),
+            "failed_retained": counts.get('failed', 0),
+            "committer": self.leading,
+            "enqueued": self.enqueued,
+            "groups": self.groups,
+            "committed": self.committed,
+            "failed": self.failed,
+            "retries": self.retries,
+        }
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and self._pid == os.getpid()
+
+    @property
+    def leading(self):
+        """True while this process runs the dyno's committer."""
+        return self._leader_file is not None and self._leader_pid == os.getpid()
+
+    def start(self):
+        """Start this process's committer thread (idempotent)."""
+        if self.running:
+            return
+        with self._start_lock:
+            # Checking the pid keeps this right across a fork: threads don't survive it.
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                with self._lock:
+                    self._db()
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name='ingest-committer', daemon=True)
+                self._thread.start()
+
+    def close(self, timeout=20.0):
+        """
+        Stop the committer and, before the process exits, wait until nothing
+        is left queued: committing it here if this process can take the
+        committer role, or leaving it to the process that holds it.
+        """
+        if self._pid != os.getpid():
+            return  # never used in this process
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        deadline = time.monotonic() + timeout
+        remaining = self.pending()
+        while remaining and time.monotonic() < deadline:
+            if self._lead():
+                try:
+                    self._commit_next()
+                except Exception as e:
+                    self._log("Ingest flush failed", error=str(e))
+                    time.sleep(0.5)
+            else:
+                time.sleep(0.1)
+            remaining = self.pending()
+        if remaining:
+            self._log("Ingest rows left in the spool at shutdown", queued=remaining, path=self.path)
+        self._release()
+
+    def _db(self):
+        # One connection per process, shared under self._lock.
+        if self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _lead(self):
+        """Take the committer role for this process if no other process holds it."""
+        if self.leading:
+            return True
+        leader_file = open(f'{self.path}.lock', 'a')
+        try:
+            # Non-blocking: a blocking flock would stall a whole gevent worker
+            fcntl.flock(leader_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            leader_file.close()
+            return False
+        self._leader_file, self._leader_pid = leader_file, os.getpid()
+        return True
+
+    def _release(self):
+        if self.leading:
+            self._leader_file.close()  # drops the flock
+        self._leader_file = None
+
+    def _run(self):
+        backoff = 0.5
+        while not self._stopping.is_set():
+            if not self._lead():
+                self._stopping.wait(1.0)
+                continue
+            try:
+                written = self._commit_next()
+                backoff = 0.5
+            except Exception as e:
+                # The database is unreachable (retryable) or the spool itself
+                # failed: never let that kill the committer.
+                self.retries += 1
+                self._log("Ingest commit will be retried", error=str(e), retry_in=backoff)
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            if not written:
+                self._prune()
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _take_group(self):
+        with self._lock:
+            db = self._db()
+            rows = db.execute(
+                "SELECT id, target, key, size FROM ingest WHERE state = 'queued' ORDER BY id LIMIT ?",
+                (self.batch_size,),
+            ).fetchall()
+            chosen, seen, size = [], set(), 0
+            for ingest_id, target, key, row_size in rows:
+                if (target, key) in seen or (chosen and size + row_size > self.max_bytes):
+                    break
+                seen.add((target, key))
+                chosen.append(ingest_id)
+                size += row_size
+            group = []
+            for ingest_id in chosen:
+                target, payload = db.execute("SELECT target, payload FROM ingest WHERE id = ?", (ingest_id,)).fetchone()
+                group.append((ingest_id, target, json.loads(payload)))
+        return group
+
+    def _commit_next(self):
+        """Write the next group; returns how many rows it took (0: nothing queued)."""
+        group = self._take_group()
+        if not group:
+            return 0
+        try:
+            results = self.write_batch(group)
+        except self.retryable:
+            raise
+        except Exception as e:
+            if len(group) == 1:
+                self._attempt_failed(group[0][0], e)
+                return 1
+            results = {}
+            for entry in group:
+                try:
+                    results.update(self.write_batch([entry]))
+                except self.retryable:
+                    self._mark_committed(results)
+                    raise
+                except Exception as e:
+                    self._attempt_failed(entry[0], e)
+        self._mark_committed(results)
+        self.groups += 1
+        return len(group)
+
+    def _mark_committed(self, results):
+        if not results:
+            return
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute('BEGIN')
+            db.executemany(
+                "UPDATE ingest SET state = 'committed', created = ?, payload = NULL, error = NULL, finished_at = ? "
+                "WHERE id = ?",
+                [(int(bool(created)), now, ingest_id) for ingest_id, created in results.items()],
+            )
+            db.execute('COMMIT')
+        self.committed += len(results)
+
+    def _attempt_failed(self, ingest_id, error):
+        with self._lock:
+            db = self._db()
+            db.execute("UPDATE ingest SET attempts = attempts + 1, error = ? WHERE id = ?", (str(error), ingest_id))
+            attempts = db.execute("SELECT attempts FROM ingest WHERE id = ?", (ingest_id,)).fetchone()[0]
+            if attempts >= self.max_attempts:
+                db.execute("UPDATE ingest SET state = 'failed', finished_at = ? WHERE id = ?", (time.time(), ingest_id))
+        if attempts >= self.max_attempts:
+            self.failed += 1
+            self._log("Ingest row failed", ingest_id=ingest_id, attempts=attempts, error=str(error))
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_prune < 60:
+            return
+        self._last_prune = now
+        with self._lock:
+            self._db().execute("DELETE FROM ingest WHERE state != 'queued' AND finished_at < ?", (now - self.retention,))
+
+    def _log(self, message, **extra):
+        if self.logger is not None:
+            self.logger.warning(message, extra=extra)
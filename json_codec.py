@@ -0,0 +1,100 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson  # optional: without it every document goes through the stdlib json module
+except ImportError:
+    orjson = None
+
+CODECS = ('auto', 'orjson', 'stdlib')
+
+
+def _plain(obj, ascii_only):
+    """
+    True for documents orjson writes exactly like json.dumps: dicts with str
+    keys, lists and tuples, str, int, bool and None (exact types, so no
+    str subclasses or floats, whose repr differs). With ascii_only, strings
+    must also be printable ASCII as far as ensure_ascii goes: orjson writes
+    non-ASCII and DEL raw where the stdlib escapes them.
+    """
+    kind = type(obj)
+    if kind is str:
+        return not ascii_only or (obj.isascii() and '\x7f' not in obj)
+    if kind is dict:
+        return all(_plain(key, ascii_only) and _plain(value, ascii_only) for key, value in obj.items())
+    if kind is list or kind is tuple:
+        return all(_plain(value, ascii_only) for value in obj)
+    return kind is int or kind is bool or obj is None
+
+
+def resolve_codec(codec):
+    """JSON_CODEC -> the codec in use: 'auto' is orjson when installed."""
+    if codec not in CODECS:
+        raise ValueError(f"Unknown JSON_CODEC {codec!r}; expected one of {', '.join(CODECS)}")
+    if codec == 'orjson' and orjson is None:
+        raise RuntimeError("JSON_CODEC=orjson needs the 'orjson' package")
+    if codec == 'auto':
+        return 'orjson' if orjson is not None else 'stdlib'
+    return codec
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask's DefaultJSONProvider, with orjson doing the work when it can.
+
+    Responses come out byte for byte as the stdlib would write them: orjson
+    only serializes compact documents of plain types (see _plain()) with
+    keys sorted the same way. Anything else (floats, dates, indent for
+    debug mode, custom separators, text ensure_ascii has to escape) goes
+    to json.dumps; escaping orjson's output again in Python measured
+    several times slower than the stdlib's C encoder.
+
+    Decoding uses orjson.loads and falls back to json.loads for whatever
+    orjson rejects (NaN, lone surrogates, non-UTF-8 bodies), so errors are
+    the stdlib's. One difference remains: integers beyond 64 bits decode
+    to float.
+    """
+
+    def __init__(self, app, codec='auto'):
+        super().__init__(app)
+        self.codec = resolve_codec(codec)
+
+    def encode(self, obj, separators=None):
+        """
+        The document as bytes through orjson, or None when only the stdlib
+        gives identical output.
+        """
+        if self.codec != 'orjson' or separators != (',', ':') or not _plain(obj, self.ensure_ascii):
+            return None
+        try:
+            data = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if self.sort_keys else 0)
+        except orjson.JSONEncodeError:  # integers beyond 64 bits, nesting deeper than orjson allows
+            return None
+        return data
+
+    def dumps(self, obj, **kwargs):
+        if set(kwargs) <= {'separators'}:
+            data = self.encode(obj, kwargs.get('separators'))
+            if data is not None:
+                return data.decode()
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self.codec == 'orjson' and not kwargs:
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                pass
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        # jsonify(). Not built on dumps(), so orjson's bytes go into the
+        # response without a str round trip.
+        obj = self._prepare_response_obj(args, kwargs)
+        compact = not ((self.compact is None and self._app.debug) or self.compact is False)
+        data = self.encode(obj, (',', ':')) if compact else None
+        if data is not None:
+            body = data + b'\n'
+        else:
+            dump_args = {'separators': (',', ':')} if compact else {'indent': 2}
+            body = f"{super().dumps(obj, **dump_args)}\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,341 @@
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+# Rough per-entry bookkeeping cost (key tuple, OrderedDict node, expiry) in bytes.
+ENTRY_OVERHEAD = 256
+
+
+def estimate_size(value):
+    """
+    Approximate the memory a cached value holds on to.
+
+    Report payloads are flat dicts whose weight is almost entirely in a few
+    large strings (text, salesletter, email_1, ...), so summing string lengths
+    is close enough to budget against and far cheaper than deep inspection.
+    """
+    if isinstance(value, dict):
+        return sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Thread-safe (and gevent-safe once monkey-patched) LRU cache with a TTL,
+    an entry limit and a byte budget.
+
+    Values are shared between callers and must be treated as read-only.
+
+    A read-through fill takes generation(key) before it reads the database
+    and passes it to set(): if invalidate(key) ran in between, the fill is
+    dropped, so a row read before a write can't be cached after it. The
+    generations of the most recently invalidated keys are kept; older ones
+    are forgotten by raising a floor, which only ever drops fills.
+    """
+
+    def __init__(self, max_bytes, max_entries, ttl):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._generations = OrderedDict()  # key -> generation of its last invalidation
+        self._generation = 0
+        self._generation_floor = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_fills = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_bytes > 0 and self.max_entries > 0
+
+    def generation(self, key):
+        """Token for a fill of `key` about to read the database; see set()."""
+        with self._lock:
+            return self._generations.get(key, self._generation_floor)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key, size)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, size=None, generation=None):
+        """
+        Cache `value`; with `generation` (from generation(key)), only if `key`
+        has not been invalidated since.
+        """
+        if not self.enabled:
+            return
+        size = (estimate_size(value) if size is None else size) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return  # would evict everything else; not worth caching
+        with self._lock:
+            if generation is not None and self._generations.get(key, self._generation_floor) != generation:
+                self.stale_fills += 1
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (value, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                oldest_key, (_, oldest_size, _) = next(iter(self._entries.items()))
+                self._remove(oldest_key, oldest_size)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._remove(key, entry[1])
+                self.invalidations += 1
+            self._generation += 1
+            self._generations.pop(key, None)
+            self._generations[key] = self._generation
+            while len(self._generations) > max(self.max_entries, 1):
+                _, forgotten = self._generations.popitem(last=False)
+                self._generation_floor = max(self._generation_floor, forgotten)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            # Fills already under way may hold rows an unseen invalidation replaced
+            self._generation += 1
+            self._generations.clear()
+            self._generation_floor = self._generation
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_fills": self.stale_fills,
+            }
+
+    def _remove(self, key, size):
+        del self._entries[key]
+        self._bytes -= size
+
+
+class RedisCacheBackend:
+    """
+    Shared cache tier for all gunicorn workers and dynos.
+
+    Reads go through a small per-worker LRUCache (L1) and then Redis (L2).
+    Writers call invalidate(), which deletes the Redis key and publishes the
+    key on `channel`; every worker runs a subscriber that drops the key from
+    its own L1, so no worker keeps serving a stale report after a write.
+
+    Fills are guarded as in LRUCache: generation(key) pairs the L1 token with
+    a per-key counter invalidate() increments in Redis, and set() writes
+    Redis only if that counter is unchanged (WATCH / MULTI), so a row read
+    before a write on any dyno can't be stored after its invalidation.
+
+    `client` is anything speaking the redis-py API (redis.Redis, or a local
+    stand-in such as fakeredis in tests). Redis errors never fail a request:
+    reads fall through to Postgres and the error is counted.
+    """
+
+    # Longer than any read-through fill takes; an expired counter only drops fills
+    GENERATION_TTL = 3600
+
+    def __init__(self, client, local, ttl, channel='lead-cache-invalidate', prefix='lead:', logger=None):
+        self.client = client
+        self.local = local
+        self.ttl = ttl
+        self.channel = channel
+        self.prefix = prefix
+        self.logger = logger
+        self.remote_hits = 0
+        self.remote_misses = 0
+        self.errors = 0
+        self.invalidations_received = 0
+        self._subscriber = None
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def generation(self, key):
+        local = self.local.generation(key)
+        try:
+            return local, self.client.get(self._generation_key(key))
+        except Exception as e:
+            self._error("Lead cache generation read failed", e)
+            return local, False  # never matches: the fill stays out of Redis
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        generation = self.local.generation(key)
+        try:
+            raw = self.client.get(self._redis_key(key))
+        except Exception as e:
+            self._error("Lead cache get failed", e)
+            return None
+        if raw is None:
+            self.remote_misses += 1
+            return None
+        self.remote_hits += 1
+        value = json.loads(raw)
+        self.local.set(key, value, size=len(raw), generation=generation)
+        return value
+
+    def set(self, key, value, size=None, generation=None):
+        if not self.enabled:
+            return
+        raw = json.dumps(value)
+        local, remote = generation if generation is not None else (None, None)
+        self.local.set(key, value, size=len(raw), generation=local)
+        try:
+            if generation is None:
+                self.client.set(self._redis_key(key), raw, ex=max(1, int(self.ttl)))
+            elif remote is not False:
+                self._set_unless_invalidated(key, raw, remote)
+        except Exception as e:
+            self._error("Lead cache set failed", e)
+
+    def invalidate(self, key):
+        self.local.invalidate(key)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.delete(self._redis_key(key))
+            pipe.incr(self._generation_key(key))
+            pipe.expire(self._generation_key(key), self.GENERATION_TTL)
+            pipe.publish(self.channel, json.dumps(list(key)))
+            pipe.execute()
+        except Exception as e:
+            self._error("Lead cache invalidation failed", e)
+
+    def clear(self):
+        self.local.clear()
+
+    def start_subscriber(self):
+        """Start the background invalidation listener for this process (idempotent)."""
+        if self._subscriber is None or not self._subscriber.is_alive():
+            self._subscriber = threading.Thread(target=self._listen, name='lead-cache-subscriber', daemon=True)
+            self._subscriber.start()
+
+    def handle_invalidation(self, message):
+        """Apply one pub/sub message published by invalidate() in any worker."""
+        self.local.invalidate(tuple(json.loads(message)))
+        self.invalidations_received += 1
+
+    def stats(self):
+        stats = self.local.stats()
+        stats.update({
+            "backend": "redis",
+            "remote_hits": self.remote_hits,
+            "remote_misses": self.remote_misses,
+            "errors": self.errors,
+            "invalidations_received": self.invalidations_received,
+        })
+        return stats
+
+    def _listen(self):
+        backoff = 0.5
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Anything published while we were disconnected is lost, so
+                # start from an empty L1 rather than trust it.
+                self.local.clear()
+                backoff = 0.5
+                for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        self.handle_invalidation(message['data'])
+            except Exception as e:
+                self._error("Lead cache subscriber disconnected", e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def _set_unless_invalidated(self, key, raw, generation):
+        from redis.exceptions import WatchError  # redis-py, which any client here comes with
+
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self._generation_key(key))
+                if pipe.get(self._generation_key(key)) != generation:
+                    self.local.stale_fills += 1
+                    return
+                pipe.multi()
+                pipe.set(self._redis_key(key), raw, ex=max(1, int(self.ttl)))
+                pipe.execute()
+            except WatchError:
+                self.local.stale_fills += 1  # invalidated while we were storing
+
+    def _redis_key(self, key):
+        return self.prefix + ':'.join(key)
+
+    def _generation_key(self, key):
+        return self.prefix + 'generation:' + ':'.join(key)
+
+    def _error(self, message, error):
+        self.errors += 1
+        if self.logger is not None:
+            self.logger.warning(message, extra={"error": str(error)})
+
+
+def make_lead_cache(backend, ttl, max_bytes, max_entries, redis_url=None, logger=None):
+    """
+    Build the cache the get_* endpoints read through.
+
+    With ttl <= 0 the cache is off. backend='redis' puts a shared Redis tier
+    (REDIS_URL) behind the per-worker LRU, and its invalidations reach every
+    worker and dyno. backend='local' keeps everything in this worker's
+    memory: a write is visible at once to the worker that made it, but
+    other workers and dynos may serve their copy for up to `ttl` seconds,
+    so it is only consistent with a single worker and logs a warning.
+    """
+    local = LRUCache(max_bytes=max_bytes, max_entries=max_entries, ttl=ttl)
+    if not local.enabled:
+        return local
+    if backend == 'local':
+        if logger is not None:
+            logger.warning("Lead cache is per worker: other workers may serve a lead for up to "
+                           "LEAD_CACHE_TTL seconds after it is written", extra={"ttl": ttl})
+        return local
+    if backend != 'redis':
+        raise ValueError(f"Unknown lead cache backend {backend!r}; expected 'local' or 'redis'")
+    if not redis_url:
+        raise ValueError("LEAD_CACHE_BACKEND=redis requires REDIS_URL")
+
+    import redis  # only needed for the shared tier
+
+    options = {}
+    if redis_url.startswith('rediss://'):
+        # Heroku Redis presents a self-signed certificate
+        options['ssl_cert_reqs'] = None
+    client = redis.Redis.from_url(redis_url, **options)
+    return RedisCacheBackend(client, local, ttl=ttl, logger=logger)
@@ -0,0 +1,163 @@
+import json
+import select
+import threading
+import time
+
+from db_drivers import install_psycopg2_wait_callback
+
+try:
+    import psycopg2  # the LISTEN connection's driver, whatever DB_DRIVER is
+except ImportError:
+    psycopg2 = None
+
+# Postgres NOTIFY channel the writers announce committed lead rows on
+CHANNEL = 'lead_written'
+
+
+class LeadWaiters:
+    """
+    Requests parked until a given (table, user_email) is written.
+
+    Each waiter is an Event; under gunicorn's gevent worker both the Event
+    and the wait on it are cooperative, so a parked request costs a greenlet
+    and no database connection.
+    """
+
+    def __init__(self, max_waiters=1000):
+        self.max_waiters = max_waiters
+        self._waiters = {}  # key -> set of Events
+        self._count = 0
+        self._lock = threading.Lock()
+        self.notified = 0
+
+    def register(self, key):
+        """Park a new waiter on `key`; returns its Event, or None when this worker is full."""
+        event = threading.Event()
+        with self._lock:
+            if self._count >= self.max_waiters:
+                return None
+            self._waiters.setdefault(key, set()).add(event)
+            self._count += 1
+        return event
+
+    def unregister(self, key, event):
+        with self._lock:
+            events = self._waiters.get(key)
+            if events is not None and event in events:
+                events.discard(event)
+                self._count -= 1
+                if not events:
+                    del self._waiters[key]
+
+    def notify(self, key):
+        with self._lock:
+            events = list(self._waiters.get(key, ()))
+        for event in events:
+            event.set()
+        self.notified += len(events)
+
+    def notify_all(self):
+        """Wake everyone to re-check, e.g. after notifications may have been missed."""
+        with self._lock:
+            events = [event for events in self._waiters.values() for event in events]
+        for event in events:
+            event.set()
+
+    def stats(self):
+        with self._lock:
+            return {"waiters": self._count, "keys": len(self._waiters), "max_waiters": self.max_waiters,
+                    "notified": self.notified}
+
+
+class LeadListener:
+    """
+    The single LISTEN connection of this worker.
+
+    Runs in a background thread (a greenlet once gevent has patched the
+    process) and hands every notification on CHANNEL to `on_notify(key)`.
+    After a reconnect, anything sent while disconnected is lost, so
+    `on_reset()` is called to let waiters re-check and caches drop their
+    contents.
+
+    Uses psycopg2 directly, whatever DB_DRIVER is: pg8000 has no way to
+    block until a notification arrives, while a psycopg2 connection can be
+    select()ed on. Under gevent, start() installs psycopg2's gevent wait
+    callback, so connecting and the keepalive query yield to the hub
+    instead of stalling every greenlet of the worker.
+    """
+
+    def __init__(self, dsn, on_notify, on_reset, channel=CHANNEL, keepalive=30, logger=None):
+        if psycopg2 is None:
+            raise ImportError("psycopg2 is required for the LISTEN connection of /wait_for_result")
+        self.dsn = dsn
+        self.on_notify = on_notify
+        self.on_reset = on_reset
+        self.channel = channel
+        self.keepalive = keepalive
+        self.logger = logger
+        self.received = 0
+        self.reconnects = 0
+        self.errors = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        """Start listening for this process (idempotent)."""
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                install_psycopg2_wait_callback()
+                self._thread = threading.Thread(target=self._run, name='lead-listener', daemon=True)
+                self._thread.start()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        backoff = 0.5
+        while True:
+            connection = None
+            try:
+                connection = psycopg2.connect(self.dsn)
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.channel}')
+                self.reconnects += 1
+                self.on_reset()
+                backoff = 0.5
+                while True:
+                    if select.select([connection], [], [], self.keepalive) == ([], [], []):
+                        # Idle: make sure the connection is still there
+                        with connection.cursor() as cursor:
+                            cursor.execute('SELECT 1')
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        notification = connection.notifies.pop(0)
+                        self.received += 1
+                        self.on_notify(tuple(json.loads(notification.payload)))
+            except Exception as e:
+                self.errors += 1
+                if self.logger is not None:
+                    self.logger.warning("Lead listener disconnected", extra={"error": str(e)})
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+    def stats(self):
+        return {"running": self.running, "received": self.received, "reconnects": self.reconnects,
+                "errors": self.errors}
+
+
+def notify_statement():
+    """SQL sending one notification per element of :payloads; runs inside the writer's transaction."""
+    return f"SELECT pg_notify('{CHANNEL}', payload) FROM unnest(CAST(:payloads AS text[])) AS payload"
+
+
+def notification_payload(table_name, user_email):
+    return json.dumps([table_name, user_email])
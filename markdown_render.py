@@ -0,0 +1,97 @@
+import hashlib
+import re
+
+from lead_cache import LRUCache
+
+# `.` never crosses a newline in the original rules, so every rule is
+# line-local and a heading line can be rendered on its own.
+_BOLD = re.compile(r'\*\*(.*?)\*\*')
+_STRONG = '<strong>{}</strong>'.format
+_H3_OPEN = '<h3 class="text-xl font-bold mb-2">'
+_H2_OPEN = '<h2 class="text-2xl font-bold mb-4">'
+
+
+def _bold(text):
+    # split() hands back [before, inner, before, inner, ..., after] entirely
+    # in C, and map(str.format) wraps the inner parts without a Python-level
+    # callback per match (which is what re.sub with a template costs).
+    if '**' not in text:
+        return text
+    parts = _BOLD.split(text)
+    parts[1::2] = map(_STRONG, parts[1::2])
+    return ''.join(parts)
+
+
+def _heading_line(line):
+    """
+    Apply the `### ` then `## ` rules to one line (no '\\n').
+
+    Each rule wraps from its first marker to the end of the line, so it fires
+    at most once per line. The `## ` rule runs on the output of the `### `
+    rule, which is why `### a ## b` nests an <h2> inside the <h3> and why the
+    closing tags always come out as </h3></h2>.
+    """
+    h3 = line.find('### ')
+    if h3 >= 0:
+        line = line[:h3] + _H3_OPEN + line[h3 + 4:] + '</h3>'
+    h2 = line.find('## ')
+    if h2 >= 0:
+        line = line[:h2] + _H2_OPEN + line[h2 + 3:] + '</h2>'
+    return line
+
+
+def render_markdown(text):
+    """
+    Render report markdown to the HTML markdown_to_html has always produced:
+    `**bold**`, `### ` / `## ` headings to end of line, newlines to <br>.
+
+    Bold is tokenized in one C-level split. A single scan then jumps between
+    `## ` markers with str.find, copying the runs of lines in between as
+    slices, so only heading lines are touched from Python. The final <br>
+    replacement runs once over the joined result. Output is byte-identical to
+    the old three re.sub passes plus str.replace.
+    """
+    text = _bold(text)
+    find = text.find
+    heading = find('## ')
+    if heading < 0:
+        return text.replace('\n', '<br>')
+
+    out = []
+    pos = 0
+    while heading >= 0:
+        start = text.rfind('\n', pos, heading) + 1
+        end = find('\n', heading)
+        if end < 0:
+            end = len(text)
+        out.append(text[pos:start])
+        out.append(_heading_line(text[start:end]))
+        pos = end
+        heading = find('## ', end)
+    out.append(text[pos:])
+    return ''.join(out).replace('\n', '<br>')
+
+
+class MarkdownRenderer:
+    """
+    render_markdown() memoized by a digest of the input, so the same report
+    body posted again (retries, overwrites with unchanged text) is not
+    re-rendered. The cache is bounded by bytes since bodies run to 200 KB.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, max_entries=2048, ttl=3600, min_size=4096):
+        self.cache = LRUCache(max_bytes=max_bytes, max_entries=max_entries, ttl=ttl)
+        self.min_size = min_size
+
+    def __call__(self, text):
+        if len(text) < self.min_size or not self.cache.enabled:
+            return render_markdown(text)  # hashing would cost about as much as rendering
+        key = hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+        html = self.cache.get(key)
+        if html is None:
+            html = render_markdown(text)
+            self.cache.set(key, html)
+        return html
+
+    def stats(self):
+        return self.cache.stats()
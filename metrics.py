@@ -0,0 +1,252 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import Request, g, has_request_context
+
+from json_codec import FastJSONProvider
+
+# Upper bounds (seconds) of the latency histogram buckets; +Inf is implied.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def add_phase(name, seconds):
+    """Charge `seconds` to phase `name` of the current request (no-op outside one)."""
+    if has_request_context() and 'metrics_phases' in g:
+        g.metrics_phases[name] += seconds
+
+
+@contextmanager
+def timed_phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(name, time.perf_counter() - start)
+
+
+def _new_histogram(buckets):
+    return {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0}
+
+
+def _observe(histogram, buckets, value):
+    for index, bound in enumerate(buckets):
+        if value <= bound:
+            histogram["buckets"][index] += 1
+            break
+    histogram["sum"] += value
+    histogram["count"] += 1
+
+
+class MetricsRegistry:
+    """
+    Request latency histograms, phase histograms and in-flight gauges for
+    one worker, exposed in the Prometheus text format.
+
+    Every gunicorn worker is its own process, so each one periodically
+    writes a snapshot to `snapshot_dir/<pid>.json`; render() merges the
+    snapshots of all live workers (its own taken fresh) so a scrape that
+    lands on any worker sees the whole dyno. Histogram buckets are stored
+    non-cumulative and summed across workers before rendering.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, snapshot_dir=None, snapshot_interval=5.0):
+        self.buckets = tuple(buckets)
+        self.snapshot_dir = snapshot_dir or os.path.join(
+            tempfile.gettempdir(), f'prognostic-metrics-{os.getppid()}')
+        self.snapshot_interval = snapshot_interval
+        self._requests = {}   # (route, method, status) -> histogram
+        self._phases = {}     # (route, phase) -> histogram
+        self._in_flight = defaultdict(int)  # route -> requests currently being handled
+        self._lock = threading.Lock()
+        self._last_snapshot = 0.0
+
+    def request_started(self, route):
+        with self._lock:
+            self._in_flight[route] += 1
+
+    def request_finished(self, route, method, status, seconds, phases):
+        with self._lock:
+            self._in_flight[route] -= 1
+            key = (route, method, str(status))
+            histogram = self._requests.get(key)
+            if histogram is None:
+                histogram = self._requests[key] = _new_histogram(self.buckets)
+            _observe(histogram, self.buckets, seconds)
+            for phase, spent in phases.items():
+                key = (route, phase)
+                histogram = self._phases.get(key)
+                if histogram is None:
+                    histogram = self._phases[key] = _new_histogram(self.buckets)
+                _observe(histogram, self.buckets, spent)
+
+    def snapshot(self, gauges=None):
+        """
+        This worker's data as a JSON-able dict. `gauges` are extra {name: value}
+        to sum across workers; names ending in _total are rendered as counters.
+        """
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "buckets": list(self.buckets),
+                "requests": [[list(key), dict(h, buckets=list(h["buckets"]))] for key, h in self._requests.items()],
+                "phases": [[list(key), dict(h, buckets=list(h["buckets"]))] for key, h in self._phases.items()],
+                "in_flight": dict(self._in_flight),
+                "gauges": dict(gauges or {}),
+            }
+
+    def maybe_write_snapshot(self, gauges=None):
+        now = time.monotonic()
+        if now - self._last_snapshot >= self.snapshot_interval:
+            self._last_snapshot = now
+            self.write_snapshot(gauges)
+
+    def write_snapshot(self, gauges=None):
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        path = os.path.join(self.snapshot_dir, f'{os.getpid()}.json')
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.snapshot(gauges), f)
+        os.replace(temporary, path)  # readers never see a half-written file
+
+    def collect(self, gauges=None):
+        """Snapshots of every live worker, with this worker's taken fresh."""
+        own = self.snapshot(gauges)
+        snapshots = [own]
+        try:
+            names = os.listdir(self.snapshot_dir)
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            pid = int(name[:-5])
+            if pid == own["pid"]:
+                continue
+            path = os.path.join(self.snapshot_dir, name)
+            if not _alive(pid):
+                # Its counters go with it; Prometheus treats that as a reset
+                _remove(path)
+                continue
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if snapshot.get("buckets") == own["buckets"]:
+                snapshots.append(snapshot)
+        return snapshots
+
+    def render(self, gauges=None, gauge_help=None):
+        """Prometheus text exposition format (version 0.0.4), merged across workers."""
+        snapshots = self.collect(gauges)
+        requests = _merge(snapshots, "requests")
+        phases = _merge(snapshots, "phases")
+        in_flight = defaultdict(int)
+        summed_gauges = defaultdict(float)
+        for snapshot in snapshots:
+            for route, value in snapshot["in_flight"].items():
+                in_flight[route] += value
+            for name, value in snapshot["gauges"].items():
+                summed_gauges[name] += value
+
+        lines = []
+        lines += self._render_histogram(
+            'http_request_duration_seconds', 'Request latency by route, method and status.',
+            ('route', 'method', 'status'), requests)
+        lines += self._render_histogram(
+            'http_request_phase_seconds',
+            'Time spent per request in pool_wait, json_parse, markdown, db_query, commit and serialize.',
+            ('route', 'phase'), phases)
+        lines.append('# HELP http_requests_in_flight Requests currently being handled, by route.')
+        lines.append('# TYPE http_requests_in_flight gauge')
+        for route in sorted(in_flight):
+            lines.append(f'http_requests_in_flight{{route="{_escape(route)}"}} {in_flight[route]}')
+        lines.append('# HELP app_workers Worker processes reporting into these metrics.')
+        lines.append('# TYPE app_workers gauge')
+        lines.append(f'app_workers {len(snapshots)}')
+        for name in sorted(summed_gauges):
+            if gauge_help and name in gauge_help:
+                lines.append(f'# HELP {name} {gauge_help[name]}')
+            lines.append(f'# TYPE {name} {"counter" if name.endswith("_total") else "gauge"}')
+            lines.append(f'{name} {_number(summed_gauges[name])}')
+        return '\n'.join(lines) + '\n'
+
+    def _render_histogram(self, name, help_text, label_names, histograms):
+        lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for key in sorted(histograms):
+            histogram = histograms[key]
+            labels = ','.join(f'{label}="{_escape(value)}"' for label, value in zip(label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram["buckets"]):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{_number(bound)}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram["count"]}')
+            lines.append(f'{name}_sum{{{labels}}} {_number(histogram["sum"])}')
+            lines.append(f'{name}_count{{{labels}}} {histogram["count"]}')
+        return lines
+
+
+def _merge(snapshots, field):
+    merged = {}
+    for snapshot in snapshots:
+        for key, histogram in snapshot[field]:
+            key = tuple(key)
+            total = merged.get(key)
+            if total is None:
+                merged[key] = {"buckets": list(histogram["buckets"]), "sum": histogram["sum"],
+                               "count": histogram["count"]}
+            else:
+                total["buckets"] = [a + b for a, b in zip(total["buckets"], histogram["buckets"])]
+                total["sum"] += histogram["sum"]
+                total["count"] += histogram["count"]
+    return merged
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class TimedRequest(Request):
+    """Request class charging body JSON decoding to the json_parse phase."""
+
+    def get_json(self, *args, **kwargs):
+        with timed_phase('json_parse'):
+            return super().get_json(*args, **kwargs)
+
+
+class TimedJSONProvider(FastJSONProvider):
+    """JSON provider charging jsonify / app.json.dumps to the serialize phase."""
+
+    def dumps(self, obj, **kwargs):
+        with timed_phase('serialize'):
+            return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        with timed_phase('serialize'):
+            return super().response(*args, **kwargs)
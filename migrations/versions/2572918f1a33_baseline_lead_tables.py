@@ -0,0 +1,86 @@
+"""Baseline lead tables
+
+The schema app.py used to create at import time. Databases that already
+have the tables (created by that code) keep them: only missing tables and
+the later updated_at columns are added, so upgrading an existing
+deployment simply records this revision.
+
+The report columns are created as TEXT. Deployments with
+TEXT_COMPRESSION set convert them afterwards with
+`flask compress-text --schema-only` (or a full `flask compress-text`).
+
+Revision ID: 2572918f1a33
+Revises:
+Create Date: 2026-10-17 01:08:48.182271
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '2572918f1a33'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+TEXT_LEAD_TABLES = ('prognostic', 'prognostic_psych', 'results_one')
+
+AUDIO_COLUMNS = (
+    'audio_link', 'audio_link_two', 'exit_message', 'headline',
+    'company_name', 'Industry', 'Products_services', 'Business_description', 'primary_goal',
+    'target_audience', 'pain_points', 'offer_name', 'offer_price', 'offer_description',
+    'primary_benefits', 'offer_goal', 'Offer_topic', 'target_url', 'testimonials',
+    'email_1', 'email_2', 'salesletter',
+    'user_name', 'website_url', 'lead_email', 'offer_url',
+)
+
+
+def lead_columns():
+    return [
+        sa.Column('user_id', postgresql.UUID(as_uuid=True), primary_key=True, unique=True, nullable=False),
+        sa.Column('user_email', sa.String(), unique=True, nullable=False),
+        sa.Column('text', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('booking_button_name', sa.Text(), nullable=True),
+        sa.Column('booking_button_redirection', sa.Text(), nullable=True),
+    ]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    existing = set(inspector.get_table_names())
+
+    for table_name in TEXT_LEAD_TABLES:
+        if table_name not in existing:
+            op.create_table(table_name, *lead_columns())
+
+    if 'results_two' not in existing:
+        op.create_table(
+            'results_two',
+            *lead_columns(),
+            *[sa.Column(name, sa.Text(), nullable=True) for name in AUDIO_COLUMNS],
+        )
+
+    if 'user_audio' not in existing:
+        op.create_table(
+            'user_audio',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('user_email', sa.String(), unique=True, nullable=False),
+            *[sa.Column(name, sa.Text(), nullable=True) for name in AUDIO_COLUMNS],
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+        )
+
+    # Tables created before updated_at existed
+    for table_name in (*TEXT_LEAD_TABLES, 'results_two', 'user_audio'):
+        if table_name in existing:
+            columns = {column['name'] for column in inspector.get_columns(table_name)}
+            if 'updated_at' not in columns:
+                op.add_column(table_name, sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    # The baseline owns the lead data; dropping it is never done by a migration.
+    raise RuntimeError('The baseline migration cannot be downgraded')
@@ -0,0 +1,83 @@
+"""Normalized email_key lookups and lead_email index
+
+Adds email_key = lower(trimmed user_email) to every lead table under a
+unique index; lookups and upserts use it, so 'Jane@X.com ' and
+'jane@x.com' are the same lead. The app writes the key itself
+(upsert.normalize_email); this migration backfills existing rows.
+
+Existing rows that only differed by case or surrounding whitespace become
+duplicates of one key. The most recently written row of each key is kept,
+which is what the next write for that lead would have resolved to anyway;
+the older ones are moved, not just deleted, into <table>_email_key_duplicates
+(same columns, no constraints), and the upgrade logs how many per table.
+Check those tables and drop them by hand. The downgrade leaves them alone
+and does not put their rows back.
+
+Revision ID: 3dd4c21173d3
+Revises: 2572918f1a33
+Create Date: 2026-10-17 01:14:24.096804
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3dd4c21173d3'
+down_revision = '2572918f1a33'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+# table -> (primary key, when a row was last written, for alias {row})
+LEAD_TABLES = {
+    'prognostic': ('user_id', 'COALESCE({row}.updated_at, {row}.created_at)'),
+    'prognostic_psych': ('user_id', 'COALESCE({row}.updated_at, {row}.created_at)'),
+    'results_one': ('user_id', 'COALESCE({row}.updated_at, {row}.created_at)'),
+    'results_two': ('user_id', 'COALESCE({row}.updated_at, {row}.created_at)'),
+    'user_audio': ('id', "COALESCE({row}.updated_at, 'epoch')"),
+}
+
+
+def upgrade():
+    for table_name, (primary_key, written_at) in LEAD_TABLES.items():
+        op.add_column(table_name, sa.Column('email_key', sa.String(), nullable=True))
+        # Same characters as upsert.EMAIL_TRIM
+        op.execute(f"UPDATE {table_name} SET email_key = lower(btrim(user_email, E' \\t\\r\\n'))")
+        bind = op.get_bind()
+        if bind.execute(sa.text(f"SELECT count(*) > count(DISTINCT email_key) FROM {table_name}")).scalar():
+            archive_duplicates(bind, table_name, primary_key, written_at)
+        op.alter_column(table_name, 'email_key', nullable=False)
+        op.create_index(f'ix_{table_name}_email_key', table_name, ['email_key'], unique=True)
+
+    # /insert_user_two and /insert_audio fall back to lead_email
+    op.create_index('ix_results_two_lead_email', 'results_two', ['lead_email'])
+    op.create_index('ix_user_audio_lead_email', 'user_audio', ['lead_email'])
+
+
+def archive_duplicates(bind, table_name, primary_key, written_at):
+    """Keep the last written row of each key (primary key breaks ties); move the rest to the archive."""
+    archive = f'{table_name}_email_key_duplicates'
+    bind.execute(sa.text(f"CREATE TABLE IF NOT EXISTS {archive} (LIKE {table_name})"))
+    archived = bind.execute(sa.text(
+        f"WITH superseded AS ("
+        f"DELETE FROM {table_name} AS older USING {table_name} AS newer "
+        f"WHERE older.email_key = newer.email_key "
+        f"AND ({written_at.format(row='older')}, older.{primary_key}::text) "
+        f"< ({written_at.format(row='newer')}, newer.{primary_key}::text) "
+        f"RETURNING older.*) "
+        f"INSERT INTO {archive} SELECT * FROM superseded"
+    )).rowcount
+    logger.warning("%s: moved %d rows sharing an email_key into %s", table_name, archived, archive)
+
+
+def downgrade():
+    # The rows upgrade() archived stay in <table>_email_key_duplicates; they are not restored
+    op.drop_index('ix_user_audio_lead_email', table_name='user_audio')
+    op.drop_index('ix_results_two_lead_email', table_name='results_two')
+    for table_name in LEAD_TABLES:
+        op.drop_index(f'ix_{table_name}_email_key', table_name=table_name)
+        op.drop_column(table_name, 'email_key')
@@ -0,0 +1,40 @@
+"""Idempotency keys for the insert endpoints
+
+One row per Idempotency-Key: a hash of the request it was first sent
+with and, once that request succeeded, the response to replay to its
+retries. Rows expire after IDEMPOTENCY_TTL; the app deletes expired
+rows itself.
+
+Revision ID: e00906182529
+Revises: 3dd4c21173d3
+Create Date: 2026-10-17 01:52:10.418113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e00906182529'
+down_revision = '3dd4c21173d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('key', sa.String(length=255), primary_key=True),
+        sa.Column('request_hash', sa.LargeBinary(), nullable=False),
+        sa.Column('response_status', sa.Integer(), nullable=True),
+        sa.Column('response_body', sa.LargeBinary(), nullable=True),
+        sa.Column('response_type', sa.String(), nullable=True),
+        sa.Column('locked_at', sa.DateTime(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'])
+
+
+def downgrade():
+    op.drop_index('ix_idempotency_keys_expires_at', table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
@@ -0,0 +1,218 @@
+import fcntl
+import hashlib
+import itertools
+import mmap
+import os
+import string
+import struct
+import time
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, text
+
+# How far a server is in the WAL: the position a replica has replayed up
+# to, or the primary's own position
+REPLAY_LSN = text(
+    "SELECT (CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END)::text"
+)
+# The primary's position right after a commit: the consistency token of a write
+CURRENT_LSN = text("SELECT pg_current_wal_lsn()::text")
+
+
+def parse_lsn(value):
+    """'16/B374D848' -> an int to compare positions with; None for anything else."""
+    if not isinstance(value, str):
+        return None
+    high, separator, low = value.strip().partition('/')
+    if not separator or not all(0 < len(part) <= 8 and set(part) <= set(string.hexdigits) for part in (high, low)):
+        return None
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+def format_lsn(position):
+    return f'{position >> 32:X}/{position & 0xFFFFFFFF:X}'
+
+
+class WritePositions:
+    """
+    The WAL position of the latest write to each lead, shared by every
+    worker of a dyno through a memory-mapped file at `path`.
+
+    Lead keys hash into `slots` 8-byte slots, so a collision can only make
+    a read wait for a later write than its own. Positions don't go stale:
+    once the replicas have replayed one, it no longer holds reads back
+    (unless the primary is replaced by a new cluster, whose positions start
+    lower; delete the file then).
+    """
+
+    SLOT = struct.Struct('<Q')
+
+    def __init__(self, path, slots=65536):
+        self.path = path
+        self.slots = slots
+        self._file = None
+        self._map = None
+        self._pid = None
+
+    def record(self, key, position):
+        offset = self._offset(key)
+        mapped = self._mapped()
+        # Held for one compare-and-store, so a later write is never overwritten by an earlier one
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        try:
+            if position > self.SLOT.unpack_from(mapped, offset)[0]:
+                self.SLOT.pack_into(mapped, offset, position)
+        finally:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def get(self, key):
+        """The position recorded for `key` (0: none)."""
+        return self.SLOT.unpack_from(self._mapped(), self._offset(key))[0]
+
+    def _offset(self, key):
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') % self.slots * self.SLOT.size
+
+    def _mapped(self):
+        if self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            file = open(self.path, 'a+b')
+            size = self.slots * self.SLOT.size
+            if os.fstat(file.fileno()).st_size < size:
+                file.truncate(size)
+            self._file, self._map, self._pid = file, mmap.mmap(file.fileno(), size), os.getpid()
+        return self._map
+
+
+class ReplicaRouter:
+    """
+    Chooses the read replica for a request, by bind name.
+
+    pick(min_lsn, replay_lsn) takes the replicas in turn and returns the
+    first that has replayed min_lsn, or None when the primary has to serve
+    the read. The replay position each replica last reported is kept: it
+    only grows, so a replica is asked again (replay_lsn(name)) only when
+    that position is behind min_lsn or older than check_interval. A replica
+    whose check or read fails is left out for retry_interval.
+    """
+
+    def __init__(self, names, check_interval=1.0, retry_interval=10.0, logger=None):
+        self.names = list(names)
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self.logger = logger
+        self._replayed = dict.fromkeys(self.names, 0)
+        self._checked = dict.fromkeys(self.names, float('-inf'))
+        self._down_until = dict.fromkeys(self.names, 0.0)
+        self._turn = itertools.count()
+        self.replica_reads = dict.fromkeys(self.names, 0)
+        self.primary_reads = 0
+        self.fallbacks = 0
+        self.errors = 0
+
+    def candidates(self):
+        """The replicas that are up, starting with the next one in turn."""
+        if not self.names:
+            return []
+        now = time.monotonic()
+        start = next(self._turn) % len(self.names)
+        return [name for name in self.names[start:] + self.names[:start] if self._down_until[name] <= now]
+
+    def needs_check(self, name, min_lsn):
+        return (time.monotonic() - self._checked[name] >= self.check_interval
+                or (min_lsn is not None and self._replayed[name] < min_lsn))
+
+    def replayed(self, name, lsn):
+        """Record the replay position `name` reported (NULL while it restores from the archive)."""
+        self._replayed[name] = parse_lsn(lsn) or 0
+        self._checked[name] = time.monotonic()
+
+    def caught_up(self, name, min_lsn):
+        return min_lsn is None or self._replayed[name] >= min_lsn
+
+    def failed(self, name, error):
+        self._down_until[name] = time.monotonic() + self.retry_interval
+        self.errors += 1
+        if self.logger is not None:
+            self.logger.warning("Read replica left out", extra={"replica": name, "error": str(error),
+                                                                "retry_in": self.retry_interval})
+
+    def chose(self, name):
+        """Count a request's reads as going to `name` (None: the primary) and return it."""
+        if name is None:
+            self.primary_reads += 1
+        else:
+            self.replica_reads[name] += 1
+        return name
+
+    def fell_back(self, name):
+        """A replica read found nothing (or failed) and was repeated on the primary."""
+        self.replica_reads[name] -= 1
+        self.fallbacks += 1
+        self.chose(None)
+
+    def pick(self, min_lsn, replay_lsn):
+        for name in self.candidates():
+            if self.needs_check(name, min_lsn):
+                try:
+                    self.replayed(name, replay_lsn(name))
+                except Exception as e:
+                    self.failed(name, e)
+                    continue
+            if self.caught_up(name, min_lsn):
+                return self.chose(name)
+        return self.chose(None)
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "replicas": {
+                name: {
+                    "replayed_lsn": format_lsn(self._replayed[name]),
+                    "checked_seconds_ago": round(now - self._checked[name], 3) if self._replayed[name] else None,
+                    "down": self._down_until[name] > now,
+                    "reads": self.replica_reads[name],
+                }
+                for name in self.names
+            },
+            "primary_reads": self.primary_reads,
+            "fallbacks": self.fallbacks,
+            "errors": self.errors,
+        }
+
+
+class RoutingSession(Session):
+    """
+    db.session for a primary plus the read replica binds of `router`.
+
+    In a request that may read from a replica (a before_request hook sets
+    g.read_after to the WAL position the replica must have replayed, or
+    None), the first SELECT picks the replica and every SELECT outside a
+    flush goes there; a request that sets g.read_replica = None reads from
+    the primary from then on. Writes, and every other request or app
+    context, use the primary as before.
+    """
+
+    def __init__(self, db, router=None, **kwargs):
+        super().__init__(db, **kwargs)
+        self.router = router
+
+    def read_replica(self):
+        """This request's replica bind name, picking it on first use; None for the primary."""
+        if self.router is None or not has_app_context() or 'read_after' not in g:
+            return None
+        if 'read_replica' not in g:
+            g.read_replica = self.router.pick(g.read_after, self.replay_lsn)
+        return g.read_replica
+
+    def replay_lsn(self, name):
+        with self._db.engines[name].connect() as connection:
+            return connection.execute(REPLAY_LSN).scalar()
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and isinstance(clause, Select) and not self._flushing:
+            name = self.read_replica()
+            if name is not None:
+                return self._db.engines[name]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,120 @@
+import gzip
+import hashlib
+
+from lead_cache import LRUCache
+
+try:
+    import brotli  # optional: without it only gzip is offered
+except ImportError:
+    brotli = None
+
+# Bodies the after_request hook is allowed to compress
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/html', 'text/plain'}
+
+
+def parse_accept_encoding(header):
+    """Accept-Encoding -> {coding: q}, e.g. 'gzip, br;q=0.5' -> {'gzip': 1.0, 'br': 0.5}."""
+    codings = {}
+    for item in (header or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+class ResponseCompressor:
+    """
+    Accept-Encoding negotiation plus gzip / brotli encoding of response bodies.
+
+    Bodies under `min_size` bytes are sent as-is: compression would save a
+    few bytes and cost a few microseconds. cached_body() additionally keeps
+    the encoded bodies of the big report payloads, by digest, so repeat
+    reads of the same report skip the compression.
+    """
+
+    def __init__(self, enabled=True, min_size=1024, gzip_level=6, brotli_quality=6,
+                 cache_max_bytes=32 * 1024 * 1024, cache_max_entries=10000, cache_ttl=300):
+        self.enabled = enabled
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        # Preferred first when the client weighs them equally
+        self.encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+        self.cache = LRUCache(max_bytes=cache_max_bytes, max_entries=cache_max_entries, ttl=cache_ttl)
+
+    def negotiate(self, accept_encoding):
+        """The coding to send for this Accept-Encoding header, or None for identity."""
+        if not self.enabled:
+            return None
+        codings = parse_accept_encoding(accept_encoding)
+        wildcard = codings.get('*', 0.0)
+        best, best_q = None, 0.0
+        for coding in self.encodings:
+            q = codings.get(coding, wildcard)
+            if q > best_q:
+                best, best_q = coding, q
+        return best
+
+    def encode(self, body, coding):
+        if coding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        if coding == 'gzip':
+            return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+        return body
+
+    def cached_body(self, payload, coding, serialize):
+        """
+        The body for `payload` in `coding`, reusing the encoded copy of an
+        identical serialized body.
+
+        Entries are keyed by a digest of the serialized body, so they can't
+        go stale: a written report serializes differently and gets an entry
+        of its own, and the old one ages out. The cache needs nothing from
+        lead_cache and works with it off.
+
+        Returns (body, coding); coding is None when the body stays uncompressed.
+        """
+        body = serialize(payload)
+        if coding is None or len(body) < self.min_size:
+            return body, None
+        cache_key = (hashlib.blake2b(body, digest_size=16).digest(), coding)
+        encoded = self.cache.get(cache_key)
+        if encoded is None:
+            encoded = self.encode(body, coding)
+            self.cache.set(cache_key, encoded, size=len(encoded))
+        return encoded, coding
+
+    def compress_response(self, response, accept_encoding):
+        """after_request hook: compress any other large, not yet encoded, buffered response."""
+        if (not self.enabled
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or response.direct_passthrough
+                or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.status_code < 200
+                or response.status_code in (204, 304)):
+            return response
+        response.vary.add('Accept-Encoding')
+        coding = self.negotiate(accept_encoding)
+        if coding is None or response.content_length is None or response.content_length < self.min_size:
+            return response
+        response.set_data(self.encode(response.get_data(), coding))
+        response.headers['Content-Encoding'] = coding
+        return response
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['enabled'] = self.enabled
+        stats['encodings'] = list(self.encodings)
+        stats['min_size'] = self.min_size
+        return stats
@@ -0,0 +1,100 @@
+import codecs
+import re
+import urllib.parse
+
+from markdown_render import render_markdown
+
+# Bytes pulled off the request body per read. Together with the longest
+# single line of the report, this bounds what one streaming insert holds.
+READ_SIZE = 64 * 1024
+
+# Same split urllib.parse.unquote uses: percent escapes are only decoded
+# inside runs of ASCII, and each run is decoded to UTF-8 on its own.
+_ASCII_RUN = re.compile('([\x00-\x7f]+)')
+
+
+def iter_body(stream, read_size=READ_SIZE):
+    """Decode a UTF-8 request body chunk by chunk (invalid UTF-8 raises ValueError)."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    while True:
+        data = stream.read(read_size)
+        if not data:
+            break
+        chunk = decoder.decode(data)
+        if chunk:
+            yield chunk
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def iter_unquoted(chunks):
+    """
+    Streaming urllib.parse.unquote(): joining the output gives exactly
+    unquote(''.join(chunks)).
+
+    A trailing '%' or '%X' is held back until the next chunk shows whether it
+    is an escape, and the UTF-8 decoder for the current ASCII run carries a
+    multi-byte character that was split across two chunks.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    carry = ''
+    for chunk in chunks:
+        chunk = carry + chunk
+        carry = ''
+        percent = chunk.rfind('%', len(chunk) - 2)
+        if percent >= 0:
+            chunk, carry = chunk[:percent], chunk[percent:]
+        out = _unquote_chunk(chunk, decoder, final=False)
+        if out:
+            yield out
+    out = _unquote_chunk(carry, decoder, final=True)
+    if out:
+        yield out
+
+
+def _unquote_chunk(chunk, decoder, final):
+    bits = _ASCII_RUN.split(chunk)
+    out = []
+    # bits alternate [non-ASCII, ASCII run, non-ASCII, ...]
+    for i, bit in enumerate(bits):
+        if i % 2:
+            out.append(decoder.decode(urllib.parse.unquote_to_bytes(bit)))
+        elif bit:
+            # A non-ASCII character ends the run; unquote decodes each run
+            # separately, so any half-finished escape sequence is replaced.
+            out.append(decoder.decode(b'', final=True))
+            decoder.reset()
+            out.append(bit)
+    if final:
+        out.append(decoder.decode(b'', final=True))
+        decoder.reset()
+    return ''.join(out)
+
+
+def iter_rendered(chunks):
+    """
+    Streaming render_markdown(). Every rule stops at a newline, so complete
+    lines are rendered as soon as they arrive; only a partial line is carried.
+    """
+    pending = []  # pieces of the current, unfinished line
+    for chunk in chunks:
+        newline = chunk.rfind('\n')
+        if newline < 0:
+            pending.append(chunk)
+            continue
+        pending.append(chunk[:newline + 1])
+        yield render_markdown(''.join(pending))
+        pending = [chunk[newline + 1:]]
+    tail = ''.join(pending)
+    if tail:
+        yield render_markdown(tail)
+
+
+def rendered_report_stream(stream, read_size=READ_SIZE):
+    """
+    Request body -> percent-decoded -> markdown HTML, as a generator of str
+    chunks. Joined, they equal markdown_to_html(urllib.parse.unquote(body)),
+    but the whole body is never held at once.
+    """
+    return iter_rendered(iter_unquoted(iter_body(stream, read_size)))
@@ -0,0 +1,206 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Integer, LargeBinary, Text, column, func, insert, literal, literal_column, select
+from sqlalchemy import table as table_clause
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from compressed_text import CompressedText
+from db_drivers import copy_from_iterable, supports_copy
+
+# Every lead table is keyed by email_key, normalize_email(user_email), under
+# a unique index; user_email keeps the address as it was sent.
+CONFLICT_COLUMN = 'email_key'
+
+# Characters normalize_email() trims; the migration's backfill trims the same set.
+EMAIL_TRIM = ' \t\r\n'
+
+# PostgreSQL caps a single statement at 65535 bind parameters.
+MAX_BIND_PARAMS = 65535
+
+# Per-transaction staging table the streaming insert COPYs one text value into.
+STREAM_STAGING_TABLE = 'lead_stream_staging'
+
+_COPY_ESCAPES = (('\\', '\\\\'), ('\t', '\\t'), ('\r', '\\r'), ('\n', '\\n'))
+
+
+def normalize_email(user_email):
+    """The lookup key for an email: trimmed and lowercased, so variants hit the same row."""
+    return user_email.strip(EMAIL_TRIM).lower()
+
+
+def upsert_statement(table, source=None):
+    """
+    Build one INSERT ... ON CONFLICT (email_key) DO UPDATE ... RETURNING statement.
+
+    With `source` (a SELECT) the rows come from INSERT ... SELECT instead of
+    bound VALUES; its selected column names must match the target columns.
+
+    On conflict every other column (primary key included) is taken from the
+    proposed row, so an overwrite behaves exactly like the old delete + insert:
+    the row gets a fresh user_id / id and created_at, and columns that were not
+    sent come back as NULL. `(xmax = 0)` is only true for freshly inserted rows,
+    which is how callers tell a 201 from a 200.
+
+    The statement carries no values; they are bound at execution time so the
+    compiled form is cached and reused across requests.
+    """
+    stmt = pg_insert(table)
+    if source is not None:
+        stmt = stmt.from_select([column.name for column in source.selected_columns], source)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c[CONFLICT_COLUMN]],
+        set_={
+            column.name: stmt.excluded[column.name]
+            for column in table.columns
+            if column.name != CONFLICT_COLUMN
+        },
+    )
+    primary_key = list(table.primary_key.columns)[0]
+    return stmt.returning(
+        primary_key.label('pk'),
+        table.c.user_email,
+        table.c[CONFLICT_COLUMN],
+        literal_column('(xmax = 0)').label('inserted'),
+    )
+
+
+def prepare_values(model, values):
+    """
+    Fill in the per-row defaults the ORM used to generate for us.
+
+    Raises ValueError unless user_email is a non-empty string.
+    """
+    values = dict(values)
+    if not values.get('user_email') or not isinstance(values['user_email'], str):
+        raise ValueError('user_email must be a non-empty string')
+    columns = model.__table__.columns
+    values['email_key'] = normalize_email(values['user_email'])
+    if 'user_id' in columns and values.get('user_id') is None:
+        values['user_id'] = uuid.uuid4()
+    if 'created_at' in columns and values.get('created_at') is None:
+        values['created_at'] = datetime.utcnow()
+    if 'updated_at' in columns and values.get('updated_at') is None:
+        values['updated_at'] = values.get('created_at') or datetime.utcnow()
+    return values
+
+
+def upsert_row(session, model, values):
+    """
+    Insert or overwrite a single lead row in one round trip.
+
+    Returns (primary_key, inserted). The caller owns the transaction and must commit.
+    """
+    row = session.execute(upsert_statement(model.__table__), prepare_values(model, values)).one()
+    return row.pk, bool(row.inserted)
+
+
+def upsert_rows(session, model, rows, chunk_size=500):
+    """
+    Insert or overwrite many lead rows, one multi-row VALUES statement per chunk.
+
+    Every row must carry the same keys and a distinct normalize_email(user_email):
+    PostgreSQL refuses to let one ON CONFLICT statement touch the same row twice.
+    Returns {email_key: (primary_key, inserted)}. The caller owns the
+    transaction and must commit.
+    """
+    table = model.__table__
+    chunk_size = max(1, min(chunk_size, MAX_BIND_PARAMS // len(table.columns)))
+    stmt = upsert_statement(table).execution_options(insertmanyvalues_page_size=chunk_size)
+
+    # Take the row locks in key order: concurrent batches sharing leads then
+    # queue behind each other instead of deadlocking.
+    rows = sorted(rows, key=lambda values: normalize_email(values['user_email']))
+    results = {}
+    for start in range(0, len(rows), chunk_size):
+        chunk = [prepare_values(model, values) for values in rows[start:start + chunk_size]]
+        for row in session.execute(stmt, chunk):
+            results[row.email_key] = (row.pk, bool(row.inserted))
+    return results
+
+
+def copy_text_field(chunks):
+    """Escape one text value, given as str chunks, for COPY ... FROM STDIN (text format)."""
+    for chunk in chunks:
+        for char, escaped in _COPY_ESCAPES:
+            if char in chunk:
+                chunk = chunk.replace(char, escaped)
+        if chunk:
+            yield chunk
+    yield '\n'
+
+
+def copy_bytea_field(chunks):
+    """Same as copy_text_field for a bytea value given as bytes chunks (hex format)."""
+    yield '\\\\x'
+    for chunk in chunks:
+        if chunk:
+            yield chunk.hex()
+    yield '\n'
+
+
+def upsert_streamed(session, model, values, column_name, chunks):
+    """
+    Insert or overwrite a single lead row whose `column_name` value arrives as
+    an iterable of str chunks (see stream_ingest).
+
+    The chunks are sent with COPY ... FROM STDIN into a temporary table as
+    they are produced, and then moved into place with one
+    INSERT ... SELECT ... ON CONFLICT, so the full value is never assembled in
+    this process. A CompressedText column is compressed on the way through.
+    Where the driver cannot COPY, each chunk is inserted as its own staging
+    row instead. Returns (primary_key, inserted). The caller owns the transaction and must
+    commit; the staging table is dropped with it. If COPY fails the connection
+    is invalidated, and the caller only has to roll back.
+    """
+    target = model.__table__
+    values = prepare_values(model, values)
+    values.pop(column_name, None)
+
+    column_type = target.c[column_name].type
+    if isinstance(column_type, CompressedText):
+        staging_type, pg_type, empty = LargeBinary, 'bytea', b''
+        chunks = column_type.iter_compressed(chunks)
+        copy_field = copy_bytea_field
+    else:
+        staging_type, pg_type, empty = Text, 'text', ''
+        copy_field = copy_text_field
+
+    connection = session.connection()
+    driver = connection.dialect.driver
+    if supports_copy(driver):
+        # COPY needs the driver's own connection: SQLAlchemy has no streaming COPY API.
+        connection.exec_driver_sql(
+            f'CREATE TEMP TABLE {STREAM_STAGING_TABLE} ("{column_name}" {pg_type}) ON COMMIT DROP')
+        try:
+            copy_from_iterable(connection.connection.dbapi_connection, driver,
+                               f'COPY {STREAM_STAGING_TABLE} ("{column_name}") FROM STDIN', copy_field(chunks))
+        except BaseException:
+            # A failure part-way through COPY (bad UTF-8, client gone) leaves the
+            # driver connection mid-protocol, so it must not go back to the pool.
+            connection.invalidate()
+            raise
+        staging = table_clause(STREAM_STAGING_TABLE, column(column_name, staging_type))
+        value = staging.c[column_name]
+    else:
+        # No COPY on this connection (psycopg2 under gevent): one staging row
+        # per chunk, joined back together in order by the database.
+        connection.exec_driver_sql(
+            f'CREATE TEMP TABLE {STREAM_STAGING_TABLE} (seq integer, "{column_name}" {pg_type}) ON COMMIT DROP')
+        staging = table_clause(STREAM_STAGING_TABLE, column('seq', Integer), column(column_name, staging_type))
+        for seq, chunk in enumerate(chunks):
+            if chunk:
+                connection.execute(insert(staging), {'seq': seq, column_name: chunk})
+        value = select(func.coalesce(
+            func.string_agg(staging.c[column_name], aggregate_order_by(literal(empty, staging_type), staging.c.seq)),
+            literal(empty, staging_type),
+        )).scalar_subquery()
+
+    source = select(*[
+        value.label(column_name) if col.name == column_name
+        else literal(values.get(col.name), col.type).label(col.name)
+        for col in target.columns
+    ])
+    row = session.execute(upsert_statement(target, source)).one()
+    return row.pk, bool(row.inserted)